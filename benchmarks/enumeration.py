@@ -0,0 +1,104 @@
+"""Directory enumeration speed, all attributes one by one versus batched
+
+A tree of `--entries` empty files spread over `--dirs` directories is
+created (and reused if it already exists at `--tree`) and then enumerated
+the way the discoverer does, first with the old "*" attributes and one file
+per `next_files_async` call, then with the discoverer attributes and
+batches of `--batch` files.
+
+    python -m benchmarks.enumeration --entries 1000000 --tree /tmp/flumes-tree
+"""
+import argparse
+import os
+import time
+
+import gi
+
+gi.require_version("Gio", "2.0")
+from gi.repository import Gio, GLib
+
+from flumes.discoverer import FILE_ATTRIBUTES
+
+
+def create_tree(root, entries, dirs):
+    if os.path.isdir(root):
+        return
+    for d in range(dirs):
+        os.makedirs(os.path.join(root, "dir{:05d}".format(d)))
+    for i in range(entries):
+        path = os.path.join(root, "dir{:05d}".format(i % dirs), "{:08d}".format(i))
+        open(path, "w").close()
+
+
+class Crawler(object):
+    def __init__(self, root, attributes, batch):
+        self.root = Gio.File.new_for_path(root)
+        self.attributes = attributes
+        self.batch = batch
+        self.loop = GLib.MainLoop()
+        self.entries = 0
+        self.numdirs = 0
+
+    def enumerate(self, path):
+        self.numdirs += 1
+        path.enumerate_children_async(
+            self.attributes,
+            Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS,
+            0,
+            None,
+            self.on_directory_content,
+            None,
+        )
+
+    def on_directory_content(self, path, res, user_data):
+        enum = path.enumerate_children_finish(res)
+        enum.next_files_async(self.batch, 0, None, self.on_file_found, None)
+
+    def on_file_found(self, enum, res, user_data):
+        files = enum.next_files_finish(res)
+        if not files:
+            self.numdirs -= 1
+            if not self.numdirs:
+                self.loop.quit()
+            return
+        for f in files:
+            self.entries += 1
+            if f.get_file_type() == Gio.FileType.DIRECTORY:
+                self.enumerate(enum.get_child(f))
+            else:
+                f.get_modification_date_time()
+        enum.next_files_async(self.batch, 0, None, self.on_file_found, None)
+
+    def run(self):
+        self.enumerate(self.root)
+        self.loop.run()
+        return self.entries
+
+
+def measure(name, root, attributes, batch):
+    crawler = Crawler(root, attributes, batch)
+    start = time.perf_counter()
+    entries = crawler.run()
+    elapsed = time.perf_counter() - start
+    print(
+        "{:>10}: {:10.0f} entries/sec ({} entries, {:.2f}s)".format(
+            name, entries / elapsed, entries, elapsed
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--dirs", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--tree", default="/tmp/flumes-enumeration-tree")
+    args = parser.parse_args()
+
+    create_tree(args.tree, args.entries, args.dirs)
+    measure("before", args.tree, "*", 1)
+    measure("after", args.tree, FILE_ATTRIBUTES, args.batch)
+
+
+if __name__ == "__main__":
+    main()
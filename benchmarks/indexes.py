@@ -0,0 +1,114 @@
+"""Lookup and rediscovery latency before and after the hot path indexes
+
+A database with `--rows` files is created at the revision previous to the
+indexes, every file with an info, a container stream, a child stream and a
+field per stream. Then the same random sample is timed on it, before and
+after upgrading to head.
+
+    python -m benchmarks.indexes --rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from alembic import command
+from alembic.config import Config
+
+import flumes
+
+BEFORE_INDEXES = "242be726f817"
+AFTER_INDEXES = "ae84ac8f2620"
+
+
+def alembic_config(db_path):
+    config = Config()
+    cwd = os.path.abspath(os.path.dirname(flumes.__file__))
+    config.set_main_option("script_location", os.path.join(cwd, "alembic"))
+    config.set_main_option("sqlalchemy.url", "sqlite:///{}".format(db_path))
+    return config
+
+
+def populate(db_path, rows):
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO files (id, name, path) VALUES (?, ?, ?)",
+        (
+            (i, "file{:07d}.mp4".format(i), "dir{:04d}".format(i % 1000))
+            for i in range(1, rows + 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO infos (id, file_id) VALUES (?, ?)",
+        ((i, i) for i in range(1, rows + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO streams (id, parent_id, info_id, type) VALUES (?, ?, ?, ?)",
+        (
+            (2 * i - 1 + child, 2 * i - 1 if child else None, i, "stream")
+            for i in range(1, rows + 1)
+            for child in (0, 1)
+        ),
+    )
+    conn.executemany(
+        "INSERT INTO fields (stream_id, name, value) VALUES (?, ?, ?)",
+        ((i, "width", "854") for i in range(1, 2 * rows + 1)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def lookup(conn, ids):
+    for i in ids:
+        conn.execute(
+            "SELECT id FROM files WHERE name = ? AND path = ?",
+            ("file{:07d}.mp4".format(i), "dir{:04d}".format(i % 1000)),
+        ).fetchone()
+
+
+def rediscover(conn, ids):
+    # What on_discovered does for an already known file
+    for i in ids:
+        conn.execute("DELETE FROM streams WHERE info_id = ?", (i,))
+        conn.execute(
+            "INSERT INTO streams (parent_id, info_id, type) VALUES (NULL, ?, ?)",
+            (i, "stream"),
+        )
+        conn.commit()
+
+
+def measure(name, db_path, run, ids):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys=ON;")
+    start = time.perf_counter()
+    run(conn, ids)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    print("{:>24}: {:10.3f} ms/op".format(name, elapsed * 1000 / len(ids)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--rediscoveries", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "flumes.db")
+        config = alembic_config(db_path)
+        command.upgrade(config, BEFORE_INDEXES)
+        populate(db_path, args.rows)
+        lookups = random.sample(range(1, args.rows + 1), args.lookups)
+        rediscoveries = random.sample(range(1, args.rows + 1), args.rediscoveries)
+        for stage in ("before", "after"):
+            if stage == "after":
+                command.upgrade(config, AFTER_INDEXES)
+            measure("lookup " + stage, db_path, lookup, lookups)
+            measure("rediscovery " + stage, db_path, rediscover, rediscoveries)
+
+
+if __name__ == "__main__":
+    main()
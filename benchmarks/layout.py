@@ -0,0 +1,105 @@
+"""Database size of one row per field and tag versus compact JSON columns
+
+`--streams` streams with the caps fields and tags of a typical audio stream
+are written to a database at the revision previous to the compact layout,
+with a row per field and tag, and to one at head, with a JSON object per
+stream. The size of both files and the time to write them are reported.
+
+    python -m benchmarks.layout --streams 1000000
+"""
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+from alembic import command
+from alembic.config import Config
+
+import flumes
+
+BEFORE_COMPACT = "09ae9d86ef15"
+
+FIELDS = {
+    "mpegversion": "4",
+    "framed": "true",
+    "stream-format": "raw",
+    "level": "2",
+    "base-profile": "lc",
+    "profile": "lc",
+    "codec_data": "1190",
+    "rate": "48000",
+    "channels": "2",
+}
+TAGS = {
+    "audio-codec": "MPEG-4 AAC audio",
+    "maximum-bitrate": "160000",
+    "bitrate": "128000",
+    "language-code": "en",
+    "container-format": "ISO MP4/M4A",
+    "encoder": "Lavf58.76.100",
+}
+
+
+def alembic_config(db_path):
+    config = Config()
+    cwd = os.path.abspath(os.path.dirname(flumes.__file__))
+    config.set_main_option("script_location", os.path.join(cwd, "alembic"))
+    config.set_main_option("sqlalchemy.url", "sqlite:///{}".format(db_path))
+    return config
+
+
+def populate_rows(conn, streams):
+    conn.executemany(
+        "INSERT INTO streams (id, type) VALUES (?, ?)",
+        ((i, "audio") for i in range(1, streams + 1)),
+    )
+    conn.executemany(
+        "INSERT INTO fields (stream_id, name, value) VALUES (?, ?, ?)",
+        ((i, k, v) for i in range(1, streams + 1) for (k, v) in FIELDS.items()),
+    )
+    conn.executemany(
+        "INSERT INTO tags (stream_id, name, value) VALUES (?, ?, ?)",
+        ((i, k, v) for i in range(1, streams + 1) for (k, v) in TAGS.items()),
+    )
+
+
+def populate_compact(conn, streams):
+    fields = json.dumps(FIELDS, separators=(",", ":"))
+    tags = json.dumps(TAGS, separators=(",", ":"))
+    conn.executemany(
+        "INSERT INTO streams (id, type, fields, tags) VALUES (?, ?, ?, ?)",
+        ((i, "audio", fields, tags) for i in range(1, streams + 1)),
+    )
+
+
+def measure(name, tmp, revision, populate, streams):
+    db_path = os.path.join(tmp, "{}.db".format(name))
+    command.upgrade(alembic_config(db_path), revision)
+    conn = sqlite3.connect(db_path)
+    start = time.perf_counter()
+    populate(conn, streams)
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    size = os.path.getsize(db_path)
+    print(
+        "{:>10}: {:10.1f} MiB, {:8.0f} streams/sec".format(
+            name, size / 2**20, streams / elapsed
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--streams", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        measure("rows", tmp, BEFORE_COMPACT, populate_rows, args.streams)
+        measure("compact", tmp, "head", populate_compact, args.streams)
+
+
+if __name__ == "__main__":
+    main()
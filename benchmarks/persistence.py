@@ -0,0 +1,100 @@
+"""Files per second stored with a commit per item versus batched commits
+
+The synthetic tree is `--dirs` directories holding `--files` files in total,
+every file gets a `File`, an `Info` and a container with two streams, which
+is what a discovery of a regular media file ends up writing.
+
+    python -m benchmarks.persistence --files 20000 --batch-size 500
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from flumes.config import Config
+from flumes.options import Options
+from flumes.persister import Persister
+from flumes.schema import Audio, Container, File, Info, Schema, Video
+
+
+def synthetic_tree(files, dirs):
+    for i in range(files):
+        yield ("dir{:04d}".format(i % dirs), "file{:07d}.mp4".format(i))
+
+
+def store_discovery(add, db_file):
+    db_info = Info(file=db_file, duration=30 * 10**9, audio_streams=1)
+    db_info.video_streams = 1
+    add(db_info)
+    container = Container(info=db_info, media_type="video/quicktime")
+    add(container)
+    for child in (
+        Video(info=db_info, media_type="video/x-h264", width=854, height=480),
+        Audio(info=db_info, media_type="audio/mpeg", channels=2),
+    ):
+        child.fields = '{"stream-format":"avc"}'
+        container.children.append(child)
+        add(child)
+
+
+def create_schema(db_path):
+    args = Options().parse_args(["-i", "sqlite:///{}".format(db_path)])
+    return Schema(Config(args))
+
+
+def run_unbatched(schema, tree):
+    session = schema.create_session()
+    for (path, name) in tree:
+        db_file = File(name=name, path=path)
+        session.add(db_file)
+        session.commit()
+        store_discovery(session.add, db_file)
+        session.commit()
+        session.commit()
+    session.close()
+
+
+def run_batched(schema, tree, batch_size):
+    persister = Persister(schema.create_session, batch_size)
+    for (path, name) in tree:
+        db_file = File(name=name, path=path)
+        persister.add(db_file)
+        persister.done()
+        store_discovery(persister.add, db_file)
+        persister.done()
+    persister.flush()
+
+
+def measure(name, files, run):
+    start = time.perf_counter()
+    run()
+    elapsed = time.perf_counter() - start
+    print("{:>10}: {:8.0f} files/sec ({:.2f}s)".format(name, files / elapsed, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--dirs", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        schema = create_schema(os.path.join(tmp, "unbatched.db"))
+        measure(
+            "unbatched",
+            args.files,
+            lambda: run_unbatched(schema, synthetic_tree(args.files, args.dirs)),
+        )
+        schema = create_schema(os.path.join(tmp, "batched.db"))
+        measure(
+            "batched",
+            args.files,
+            lambda: run_batched(
+                schema, synthetic_tree(args.files, args.dirs), args.batch_size
+            ),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Time to index a changed file during a full scan, FIFO versus priorities
+
+A scan queues `--files` files at once, and while they are discovered by
+`--jobs` discoverers taking `--discovery-ms` each, a new file shows up
+every `--interval` seconds. The time every new file waited for a
+discoverer is reported, first with a single FIFO queue as it used to be
+done, then with the `Scheduler`. This is a simulation, no file is read.
+
+    python -m benchmarks.scheduler --files 100000 --jobs 4
+"""
+import argparse
+import collections
+import heapq
+
+from flumes.scheduler import LIVE, SCAN, Scheduler
+
+
+class Fifo(object):
+    def __init__(self):
+        self.queue = collections.deque()
+
+    def __len__(self):
+        return len(self.queue)
+
+    def push(self, item, priority=SCAN):
+        self.queue.append(item)
+
+    def pop(self):
+        return self.queue.popleft()
+
+
+def simulate(queue, files, jobs, discovery, interval, live):
+    for i in range(files):
+        queue.push((SCAN, 0), SCAN)
+    arrivals = [interval * (i + 1) for i in range(live)]
+    # Time every discoverer is free at
+    free = [0.0] * jobs
+    waits = []
+    now = 0.0
+    while len(waits) < live:
+        now = heapq.heappop(free)
+        while arrivals and arrivals[0] <= now:
+            queue.push((LIVE, arrivals.pop(0)), LIVE)
+        if not queue:
+            # Idle until the next change
+            now = arrivals[0]
+            heapq.heappush(free, now)
+            continue
+        (priority, queued) = queue.pop()
+        if priority == LIVE:
+            waits.append(now - queued)
+        heapq.heappush(free, now + discovery)
+    return waits
+
+
+def measure(name, queue, args):
+    waits = sorted(
+        simulate(
+            queue,
+            args.files,
+            args.jobs,
+            args.discovery_ms / 1000,
+            args.interval,
+            args.live,
+        )
+    )
+    print(
+        "{:>10}: {:10.2f}s median, {:10.2f}s max wait of a new file".format(
+            name, waits[len(waits) // 2], waits[-1]
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--discovery-ms", type=float, default=50)
+    parser.add_argument("--interval", type=float, default=10)
+    parser.add_argument("--live", type=int, default=50)
+    parser.add_argument("--scan-share", type=float, default=0.1)
+    args = parser.parse_args()
+
+    measure("fifo", Fifo(), args)
+    measure("scheduler", Scheduler(args.scan_share), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Memory of the discoverer over repeated forced rescans
+
+A tree with `--files` copies of a media file is discovered, and then
+rescanned with `--force` for `--rounds` rounds, the same as sending SIGUSR1
+to a long running daemon. The resident memory is reported after every
+round, and the growth between the end of the warm up rounds and the last
+round must stay under `--max-growth` percent.
+
+    python -m benchmarks.soak --files 500 --rounds 20 --media tests/samples/big-buck-bunny-480p-30sec.mp4
+"""
+import argparse
+import gc
+import os
+import resource
+import shutil
+import signal
+import sys
+import tempfile
+
+import gi
+
+gi.require_version("GLib", "2.0")
+from gi.repository import GLib
+
+from flumes.config import Config
+from flumes.discoverer import Discoverer, DiscovererOptions
+
+
+def create_tree(root, media, files, dirs):
+    ext = os.path.splitext(media)[1]
+    first = os.path.join(root, "media{}".format(ext))
+    os.makedirs(root)
+    shutil.copy(media, first)
+    for i in range(files):
+        path = os.path.join(root, "dir{:03d}".format(i % dirs))
+        os.makedirs(path, exist_ok=True)
+        os.link(first, os.path.join(path, "{:06d}{}".format(i, ext)))
+    os.unlink(first)
+
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+class Soak(object):
+    def __init__(self, discoverer, rounds):
+        self.discoverer = discoverer
+        self.rounds = rounds
+        self.samples = []
+
+    def on_check(self):
+        discoverer = self.discoverer
+        if discoverer.numdirs or discoverer.numdiscoveries:
+            return True
+        gc.collect()
+        self.samples.append(rss())
+        print(
+            "{:>10}: {:8.1f} MiB".format(
+                "round {}".format(len(self.samples)), self.samples[-1] / 2**20
+            )
+        )
+        if len(self.samples) > self.rounds:
+            discoverer.stop()
+            return False
+        discoverer.on_usr1_signal(signal.SIGUSR1)
+        return True
+
+    def run(self):
+        GLib.timeout_add(100, self.on_check)
+        self.discoverer.start()
+        return self.samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--dirs", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--max-growth", type=float, default=10)
+    parser.add_argument(
+        "--media", default="tests/samples/big-buck-bunny-480p-30sec.mp4"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tree = os.path.join(tmp, "tree")
+        create_tree(tree, os.path.abspath(args.media), args.files, args.dirs)
+        options = DiscovererOptions()
+        discoverer_args = options.parse_args(
+            ["-d", tree, "-i", "sqlite:///{}/soak.db".format(tmp), "-f"]
+        )
+        discoverer = Discoverer(Config(discoverer_args), discoverer_args)
+        samples = Soak(discoverer, args.rounds).run()
+
+    start = samples[min(args.warmup, len(samples) - 1)]
+    growth = (samples[-1] - start) * 100 / start
+    print("{:>10}: {:8.1f} %".format("growth", growth))
+    if growth > args.max_growth:
+        sys.exit("Memory grew more than {}%".format(args.max_growth))
+
+
+if __name__ == "__main__":
+    main()
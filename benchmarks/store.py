@@ -0,0 +1,122 @@
+"""CPU spent storing a discovery, ORM objects versus Core inserts
+
+A media file is discovered once and its serialized `DiscovererInfo`, the
+same record the discovery cache keeps, is stored for `--files` files, first
+with one ORM object per stream as it used to be done, then with the current
+`InfoStore`. Finally it is stored again on the same files,
+as a forced rescan where nothing changed does.
+
+    python -m benchmarks.store --files 2000 --media tests/samples/big-buck-bunny-480p-30sec.mp4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import gi
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GstPbutils", "1.0")
+from gi.repository import Gst, GstPbutils
+
+from flumes.config import Config
+from flumes.options import Options
+from flumes.persister import Persister
+from flumes.schema import Audio, Container, File, Schema, Stream, Subtitle, Video
+from flumes.store import InfoStore
+
+STREAM_CLASSES = {
+    "container": Container,
+    "video": Video,
+    "audio": Audio,
+    "subtitle": Subtitle,
+    "stream": Stream,
+}
+
+
+class OrmInfoStore(InfoStore):
+    """The previous store, every stream is an ORM object"""
+
+    def insert_streams(self, info_id, nodes, ids):
+        db_streams = []
+        for (columns, parent) in nodes:
+            columns = dict(columns)
+            db_stream = STREAM_CLASSES[columns.pop("type")](info_id=info_id, **columns)
+            if parent is not None:
+                db_streams[parent].children.append(db_stream)
+            self.persister.add(db_stream)
+            db_streams.append(db_stream)
+
+
+def record(media):
+    discoverer = GstPbutils.Discoverer.new(5 * Gst.SECOND)
+    info = discoverer.discover_uri(Gst.filename_to_uri(media))
+    variant = info.to_variant(GstPbutils.DiscovererSerializeFlags.ALL)
+    return GstPbutils.DiscovererInfo.from_variant(variant)
+
+
+def create_schema(db_path):
+    args = Options().parse_args(["-i", "sqlite:///{}".format(db_path)])
+    return Schema(Config(args))
+
+
+def run(schema, store_class, info, files, batch_size):
+    persister = Persister(schema.create_session, batch_size)
+    store = store_class(persister)
+    for i in range(files):
+        db_file = File(name="file{:07d}.mp4".format(i), path="")
+        persister.add(db_file)
+        store.store(db_file, info)
+        persister.done()
+    persister.flush()
+
+
+def run_again(schema, info, batch_size):
+    persister = Persister(schema.create_session, batch_size)
+    store = InfoStore(persister)
+    ids = [file_id for (file_id,) in persister.session.query(File.id)]
+    for file_id in ids:
+        # Each batch has its own session
+        db_file = persister.session.get(File, file_id)
+        store.store(db_file, info)
+        persister.done()
+    persister.flush()
+
+
+def measure(name, files, run):
+    start = time.process_time()
+    run()
+    elapsed = time.process_time() - start
+    print(
+        "{:>10}: {:8.0f} us of CPU per file ({:.2f}s)".format(
+            name, elapsed * 10**6 / files, elapsed
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--media", default="tests/samples/big-buck-bunny-480p-30sec.mp4"
+    )
+    args = parser.parse_args()
+
+    Gst.init(None)
+    info = record(os.path.abspath(args.media))
+    with tempfile.TemporaryDirectory() as tmp:
+        for (name, store_class) in (("orm", OrmInfoStore), ("core", InfoStore)):
+            schema = create_schema(os.path.join(tmp, "{}.db".format(name)))
+            measure(
+                name,
+                args.files,
+                lambda: run(schema, store_class, info, args.files, args.batch_size),
+            )
+        measure(
+            "unchanged", args.files, lambda: run_again(schema, info, args.batch_size)
+        )
+
+
+if __name__ == "__main__":
+    main()
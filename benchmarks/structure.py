@@ -0,0 +1,65 @@
+"""Structures parsed per second, the former regex versus the tokenizer
+
+Both parse the `to_string()` output of typical caps and tags `--count`
+times. The regex is the fallback used before the tokenizer, when the Gst
+overrides are not available.
+
+    python -m benchmarks.structure --count 100000
+"""
+import argparse
+import re
+import time
+
+from flumes.structure import parse_fields
+
+STRUCTURES = [
+    "video/x-h264, stream-format=(string)avc, alignment=(string)au, "
+    "level=(string)3, profile=(string)high, codec_data=(buffer)0164001effe1001b, "
+    "width=(int)854, height=(int)480, framerate=(fraction)30/1, "
+    "pixel-aspect-ratio=(fraction)1/1, parsed=(boolean)true;",
+    "audio/mpeg, mpegversion=(int)4, framed=(boolean)true, "
+    "stream-format=(string)raw, level=(string)2, base-profile=(string)lc, "
+    "profile=(string)lc, codec_data=(buffer)1190, rate=(int)48000, "
+    "channels=(int)2;",
+    'taglist, audio-codec=(string)"MPEG-4\\ AAC\\ audio", '
+    "maximum-bitrate=(uint)160000, bitrate=(uint)128000, "
+    "language-code=(string)en, encoder=(string)Lavf58.76.100;",
+]
+
+
+def parse_regex(s):
+    taglist = re.sub("(\\{(?:\\[??[^\\[]*?\\}))", "", s)
+    fields = taglist.split(",")
+    if len(fields) > 1:
+        regex = r"(?P<key>[\w-]*)\=\((?P<type>\w+)\)[\"]?(?P<value>[\w -\\]*)[\"]?"
+        regex_c = re.compile(regex)
+        # Remove trailing semicolon
+        for field in fields[1:-1] + [fields[-1][:-1]]:
+            groups = re.match(regex_c, field.strip())
+            yield (groups.group("key"), groups.group("type"), groups.group("value"))
+
+
+def measure(name, parse, count):
+    start = time.perf_counter()
+    for i in range(count):
+        for s in STRUCTURES:
+            list(parse(s))
+    elapsed = time.perf_counter() - start
+    print(
+        "{:>10}: {:10.0f} structures/sec".format(
+            name, count * len(STRUCTURES) / elapsed
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    measure("regex", parse_regex, args.count)
+    measure("tokenizer", parse_fields, args.count)
+
+
+if __name__ == "__main__":
+    main()
@@ -62,6 +62,11 @@ def run_migrations_online():
     )
 
     with connectable.connect() as connection:
+        # Tables are recreated by the batch operations on SQLite, dropping
+        # them would delete the rows referencing them in cascade. The pragma
+        # is a no-op inside a transaction, set it before the migration starts
+        if connection.dialect.name == "sqlite":
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
         context.configure(
             connection=connection, target_metadata=target_metadata, render_as_batch=True
         )
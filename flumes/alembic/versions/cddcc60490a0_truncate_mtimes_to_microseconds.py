@@ -0,0 +1,29 @@
+"""truncate mtimes to microseconds
+
+Revision ID: cddcc60490a0
+Revises: 539ee86b0574
+Create Date: 2026-10-19 10:12:40.518273
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "cddcc60490a0"
+down_revision = "539ee86b0574"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The scan used the nanoseconds when GLib had them, fingerprints only
+    # have microseconds now
+    for table in ("files", "directories", "errors"):
+        op.execute(
+            "UPDATE {0} SET mtime_ns = mtime_ns - mtime_ns % 1000 "
+            "WHERE mtime_ns % 1000 != 0".format(table)
+        )
+
+
+def downgrade():
+    # The nanoseconds are lost, the microseconds are still valid mtimes
+    pass
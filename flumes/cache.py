@@ -0,0 +1,65 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+import gi
+
+gi.require_version("GstPbutils", "1.0")
+from gi.repository import GLib, GstPbutils
+
+logger = logging.getLogger(__name__)
+
+
+class InfoCache(object):
+    """On-disk cache of serialized GstDiscovererInfo
+
+    Every entry is stored under the hash of the fingerprint of the file it
+    was discovered from, so the database can be rebuilt without running
+    GStreamer again on files that did not change.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, fprint):
+        return hashlib.sha1(":".join(str(v) for v in fprint).encode()).hexdigest()
+
+    def path(self, fprint):
+        key = self.key(fprint)
+        return os.path.join(self.directory, key[:2], key)
+
+    def put(self, fprint, info):
+        if None in fprint:
+            return
+        variant = info.to_variant(GstPbutils.DiscovererSerializeFlags.ALL)
+        path = self.path(fprint)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write it atomically, a reader should never find half an entry
+        (fd, tmp) = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(variant.get_type_string().encode() + b"\n")
+                f.write(variant.get_data_as_bytes().get_data())
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.error("Couldn't cache {}: {}".format(info.get_uri(), e))
+            os.unlink(tmp)
+
+    def get(self, fprint):
+        if None in fprint:
+            return None
+        try:
+            with open(self.path(fprint), "rb") as f:
+                type_string = f.readline().strip().decode()
+                data = f.read()
+        except OSError:
+            return None
+        if not GLib.VariantType.string_is_valid(type_string):
+            logger.error("Invalid cache entry {}".format(self.key(fprint)))
+            return None
+        variant = GLib.Variant.new_from_bytes(
+            GLib.VariantType.new(type_string), GLib.Bytes.new(data), False
+        )
+        return GstPbutils.DiscovererInfo.from_variant(variant)
@@ -19,6 +19,44 @@ class Config(object):
         "port",
         "database",
     ]
+    conf_batch_args = [
+        "batch_size",
+        "batch_timeout",
+    ]
+    DEFAULT_BATCH_SIZE = 500
+    DEFAULT_BATCH_TIMEOUT = 1000
+    # SQLite pragmas, in the order they are applied
+    conf_sqlite_args = [
+        "busy_timeout",
+        "journal_mode",
+        "synchronous",
+        "mmap_size",
+        "cache_size",
+        "temp_store",
+    ]
+    conf_sqlite_choices = {
+        "journal_mode": ["DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"],
+        "synchronous": ["OFF", "NORMAL", "FULL", "EXTRA"],
+        "temp_store": ["DEFAULT", "FILE", "MEMORY"],
+    }
+    conf_sqlite_defaults = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+    }
+    # Tag storage, from the tags_* arguments
+    conf_tags_args = [
+        "allow",
+        "deny",
+        "max_size",
+    ]
+    DEFAULT_TAG_MAX_SIZE = 1024
+    # Files to discover
+    conf_filter_args = [
+        "include",
+        "exclude",
+        "extensions",
+        "sniff",
+    ]
 
     def __init__(self, args=None):
         user_configuration = "{}/{}".format(os.getenv("HOME"), ".flumes")
@@ -36,12 +74,66 @@ class Config(object):
         # override now with passed in arguments
         if not "Database" in self.config:
             self.config["Database"] = {}
+        if not "SQLite" in self.config:
+            self.config["SQLite"] = {}
+        if not "Cache" in self.config:
+            self.config["Cache"] = {}
+        if not "Tags" in self.config:
+            self.config["Tags"] = {}
+        if not "Filter" in self.config:
+            self.config["Filter"] = {}
 
         if args:
             for c in self.conf_database_args:
                 cv = getattr(args, c, None)
                 if cv:
                     self.config["Database"][c] = str(cv)
+            for c in self.conf_batch_args:
+                cv = getattr(args, c, None)
+                if cv is not None:
+                    self.config["Database"][c] = str(cv)
+            for c in self.conf_sqlite_args:
+                cv = getattr(args, c, None)
+                if cv is not None:
+                    self.config["SQLite"][c] = str(cv)
+            cv = getattr(args, "cache", None)
+            if cv:
+                self.config["Cache"]["directory"] = cv
+            for c in self.conf_tags_args:
+                cv = getattr(args, "tags_{}".format(c), None)
+                if cv is not None:
+                    self.config["Tags"][c] = str(cv)
+            for c in self.conf_filter_args:
+                cv = getattr(args, c, None)
+                if cv is not None:
+                    self.config["Filter"][c] = str(cv)
+
+        # Validate the SQLite profile, the values end up in PRAGMA statements
+        for c in self.conf_sqlite_args:
+            if not c in self.config["SQLite"]:
+                continue
+            cv = self.config["SQLite"][c].upper()
+            if c in self.conf_sqlite_choices:
+                if not cv in self.conf_sqlite_choices[c]:
+                    raise ConfigError("Invalid SQLite {} {}".format(c, cv))
+            else:
+                try:
+                    int(cv)
+                except ValueError:
+                    raise ConfigError("Invalid SQLite {} {}".format(c, cv))
+
+        try:
+            self.get_tags_max_size()
+        except ValueError:
+            raise ConfigError(
+                "Invalid tags max_size {}".format(self.config["Tags"]["max_size"])
+            )
+        try:
+            self.get_filter_sniff()
+        except ValueError:
+            raise ConfigError(
+                "Invalid filter sniff {}".format(self.config["Filter"]["sniff"])
+            )
 
         # Generate the other parameters based on the uri
         if "uri" in self.config["Database"]:
@@ -92,3 +184,47 @@ class Config(object):
 
     def get_database_database(self):
         return self.config["Database"]["database"]
+
+    def get_database_batch_size(self):
+        return self.config["Database"].getint("batch_size", self.DEFAULT_BATCH_SIZE)
+
+    def get_database_batch_timeout(self):
+        return self.config["Database"].getint(
+            "batch_timeout", self.DEFAULT_BATCH_TIMEOUT
+        )
+
+    def get_sqlite_pragmas(self):
+        pragmas = []
+        for c in self.conf_sqlite_args:
+            cv = self.config["SQLite"].get(c, self.conf_sqlite_defaults.get(c))
+            if cv is not None:
+                pragmas.append((c, cv.upper()))
+        return pragmas
+
+    def get_cache_directory(self):
+        return self.config["Cache"].get("directory", None)
+
+    def _get_list(self, section, c):
+        cv = self.config[section].get(c, "")
+        return [t.strip() for t in cv.split(",") if t.strip()]
+
+    def get_tags_allow(self):
+        return self._get_list("Tags", "allow")
+
+    def get_tags_deny(self):
+        return self._get_list("Tags", "deny")
+
+    def get_tags_max_size(self):
+        return self.config["Tags"].getint("max_size", self.DEFAULT_TAG_MAX_SIZE)
+
+    def get_filter_include(self):
+        return self._get_list("Filter", "include")
+
+    def get_filter_exclude(self):
+        return self._get_list("Filter", "exclude")
+
+    def get_filter_extensions(self):
+        return self._get_list("Filter", "extensions")
+
+    def get_filter_sniff(self):
+        return self.config["Filter"].getboolean("sniff", False)
@@ -0,0 +1,172 @@
+"""Control of a running discoverer through a Unix socket
+
+Clients send one JSON object per line, with the `command` to run and its
+arguments, and get one JSON object per line back, with `ok` set and the
+results, or with `ok` unset and an `error`:
+
+    {"command": "status"}
+    {"command": "metrics"}
+    {"command": "rescan", "path": "movies/2022"}
+    {"command": "rescan", "path": "movies/2022", "force": true}
+    {"command": "discover", "path": "movies/2022/a.mp4"}
+    {"command": "retry_errors"}
+    {"command": "pause"}
+    {"command": "resume"}
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+
+import gi
+
+gi.require_version("Gio", "2.0")
+from gi.repository import Gio, GLib
+
+logger = logging.getLogger(__name__)
+
+
+class ControlError(Exception):
+    pass
+
+
+class ControlServer(object):
+    """Serves the commands of the `handler` on the GLib main loop
+
+    Every command is a `control_<command>` method of the handler, called
+    with the arguments of the request and returning a dict to reply with.
+    It raises ControlError on invalid requests.
+    """
+
+    def __init__(self, handler, path):
+        self.handler = handler
+        self.path = path
+        self.connections = set()
+        # A socket left by a previous run would make the bind fail
+        if os.path.exists(path):
+            os.unlink(path)
+        self.service = Gio.SocketService()
+        self.service.add_address(
+            Gio.UnixSocketAddress.new(path),
+            Gio.SocketType.STREAM,
+            Gio.SocketProtocol.DEFAULT,
+            None,
+        )
+        self.service.connect("incoming", self.on_incoming)
+        self.service.start()
+        logger.info("Listening for commands on {}".format(path))
+
+    def on_incoming(self, service, connection, source):
+        stream = Gio.DataInputStream.new(connection.get_input_stream())
+        self.connections.add(connection)
+        self.read_line(stream, connection)
+        return True
+
+    def read_line(self, stream, connection):
+        stream.read_line_async(GLib.PRIORITY_DEFAULT, None, self.on_line, connection)
+
+    def on_line(self, stream, res, connection):
+        try:
+            (line, length) = stream.read_line_finish_utf8(res)
+        except GLib.Error as e:
+            logger.debug("Control connection failed: {}".format(e))
+            line = None
+        if line is None:
+            self.connections.discard(connection)
+            connection.close(None)
+            return
+        if line.strip():
+            reply = self.run(line)
+            try:
+                connection.get_output_stream().write_all(
+                    (json.dumps(reply) + "\n").encode("utf-8"), None
+                )
+            except GLib.Error as e:
+                logger.debug("Control connection failed: {}".format(e))
+                self.connections.discard(connection)
+                return
+        self.read_line(stream, connection)
+
+    def run(self, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ControlError("Requests must be objects")
+            command = request.pop("command", None)
+            method = getattr(self.handler, "control_{}".format(command), None)
+            if not command or not method:
+                raise ControlError("Unknown command {}".format(command))
+            logger.debug("Running control command {}".format(command))
+            reply = method(**request)
+        except ValueError as e:
+            return {"ok": False, "error": "Invalid request: {}".format(e)}
+        except TypeError as e:
+            return {"ok": False, "error": "Invalid arguments: {}".format(e)}
+        except ControlError as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            # Keep serving, a failed command must not stop the discoverer
+            logger.exception("Control command failed")
+            return {"ok": False, "error": "Command failed: {}".format(e)}
+        reply["ok"] = True
+        return reply
+
+    def stop(self):
+        self.service.stop()
+        self.service.close()
+        for connection in self.connections:
+            connection.close(None)
+        self.connections.clear()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Send a command to a running discoverer"
+    )
+    parser.add_argument("socket", help="control socket of the discoverer")
+    parser.add_argument(
+        "command",
+        choices=[
+            "status",
+            "metrics",
+            "rescan",
+            "discover",
+            "retry_errors",
+            "pause",
+            "resume",
+        ],
+    )
+    parser.add_argument(
+        "path", nargs="?", help="path to rescan or discover, relative to its root"
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        default=False,
+        help="rescan unchanged files too",
+    )
+    args = parser.parse_args()
+    request = {"command": args.command}
+    if args.path is not None:
+        request["path"] = args.path
+    if args.force:
+        request["force"] = True
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(args.socket)
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        reply = json.loads(sock.makefile("r", encoding="utf-8").readline())
+    if "metrics" in reply:
+        print(reply["metrics"], end="")
+    else:
+        print(json.dumps(reply, indent=2))
+    if not reply.get("ok"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
@@ -1,42 +1,80 @@
-import datetime
-import importlib
+import collections
 import logging
 import os
-import re
 import signal
 import sys
-from datetime import timezone
+import time
+from datetime import datetime, timezone
 from urllib.parse import urlparse
 
-import dateutil.parser
 import gi
 from pip import main
 
 gi.require_version("Gst", "1.0")
 gi.require_version("GstPbutils", "1.0")
 from gi.repository import Gio, GLib, Gst, GstPbutils
+from sqlalchemy import and_, func, literal, or_, select
 
-from . import __version__
+from . import __version__, metrics
+from .cache import InfoCache
 from .config import Config
+from .control import ControlError, ControlServer
+from .index import DirectoryIndex, FileIndex
+from .metrics import MetricsServer
 from .options import Options
-from .schema import (
-    Audio,
-    Container,
-    Error,
-    Field,
-    File,
-    Info,
-    Meta,
-    Schema,
-    Stream,
-    Subtitle,
-    Tag,
-    Video,
-)
+from .persister import Persister
+from .prefilter import Prefilter
+from .scheduler import LIVE, PRIORITY_NAMES, REQUEST, SCAN, Scheduler
+from .schema import Directory, Error, File, Info, Meta, Schema
+from .store import InfoStore
+from .structure import StructureError
+from .watcher import Watcher
 
 logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Only the attributes the scan uses, "*" makes GIO compute content types,
+# icons, thumbnails and the like for every file
+FILE_ATTRIBUTES = ",".join(
+    [
+        Gio.FILE_ATTRIBUTE_STANDARD_NAME,
+        Gio.FILE_ATTRIBUTE_STANDARD_TYPE,
+        Gio.FILE_ATTRIBUTE_STANDARD_SIZE,
+        Gio.FILE_ATTRIBUTE_TIME_MODIFIED,
+        Gio.FILE_ATTRIBUTE_TIME_MODIFIED_USEC,
+        Gio.FILE_ATTRIBUTE_UNIX_INODE,
+        Gio.FILE_ATTRIBUTE_UNIX_DEVICE,
+    ]
+)
+# Seconds a deleted file is kept around in case it shows up again somewhere
+# else, as a move does when it is reported as a deletion and a creation
+MOVE_TIMEOUT = 2
+# Number of unchanged files stamped with the scan generation at once
+STAMP_BATCH = 500
+# Directories enumerated at once, the rest wait for one of them to finish
+MAX_OPEN_DIRS = 32
+# Seconds to wait before retrying a discovery that timed out, doubled on
+# every attempt
+RETRY_DELAY = 5
+# The first timeout of a file is at least this many times the time its last
+# discovery took
+SLOW_FACTOR = 2
+
+
+def fingerprint(finfo):
+    # The (size, mtime in nanoseconds, inode) of a file, any change on it
+    # will trigger a new discovery. The mtime is truncated to microseconds,
+    # the nanoseconds are only available since GLib 2.74 and the fingerprint
+    # must not change with the GLib version
+    mtime_ns = finfo.get_attribute_uint64(Gio.FILE_ATTRIBUTE_TIME_MODIFIED) * 10**9
+    usec = finfo.get_attribute_uint32(Gio.FILE_ATTRIBUTE_TIME_MODIFIED_USEC)
+    mtime_ns += usec * 1000
+    return (
+        finfo.get_size(),
+        mtime_ns,
+        finfo.get_attribute_uint64(Gio.FILE_ATTRIBUTE_UNIX_INODE),
+    )
+
 
 class DiscovererOptions(Options):
     def __init__(self, *args, **kwargs):
@@ -51,6 +89,159 @@ class DiscovererOptions(Options):
         group.add_argument(
             "-f", "--force", action="store_true", default=False, help="force rescanning"
         )
+        group.add_argument(
+            "--retry-errors",
+            action="store_true",
+            default=False,
+            help="discover again the files that failed, even if they did not change",
+        )
+        group.add_argument(
+            "-j",
+            "--jobs",
+            action="store",
+            type=int,
+            default=1,
+            help="number of files to discover in parallel",
+        )
+        group.add_argument(
+            "--timeout",
+            action="store",
+            type=float,
+            default=5,
+            help="seconds to discover a file, before adding the time to read it",
+        )
+        group.add_argument(
+            "--timeout-rate",
+            action="store",
+            type=float,
+            default=10,
+            help="MiB per second a file is expected to be read at",
+        )
+        group.add_argument(
+            "--max-timeout",
+            action="store",
+            type=float,
+            default=60,
+            help="maximum seconds to discover a file, before retrying it",
+        )
+        group.add_argument(
+            "--retries",
+            action="store",
+            type=int,
+            default=2,
+            help="times to retry a discovery that timed out, doubling its timeout",
+        )
+        group.add_argument(
+            "--scan-share",
+            action="store",
+            type=float,
+            default=0.1,
+            help="share of the discoveries given to the scan while there are "
+            "changes or requests waiting",
+        )
+        group.add_argument(
+            "--max-pending",
+            action="store",
+            type=int,
+            default=1000,
+            help="files waiting for discovery before pausing an enumeration",
+        )
+        group.add_argument(
+            "--scan-batch",
+            action="store",
+            type=int,
+            default=256,
+            help="directory entries to read at once",
+        )
+        group.add_argument(
+            "--debounce",
+            action="store",
+            type=int,
+            default=1000,
+            help="milliseconds without changes before discovering a new file",
+        )
+        group.add_argument(
+            "--max-watches",
+            action="store",
+            type=int,
+            help="maximum number of directories to monitor",
+        )
+        group.add_argument(
+            "--control-socket",
+            action="store",
+            help="unix socket to listen for commands on",
+        )
+        group.add_argument(
+            "--metrics-port",
+            action="store",
+            type=int,
+            help="localhost port to serve the Prometheus metrics on",
+        )
+        group = self.add_argument_group("filter")
+        group.add_argument(
+            "--include",
+            action="store",
+            help="comma separated list of globs of the only files to discover",
+        )
+        group.add_argument(
+            "--exclude",
+            action="store",
+            help="comma separated list of globs of files not to discover",
+        )
+        group.add_argument(
+            "--extensions",
+            action="store",
+            help="comma separated list of the only file extensions to discover",
+        )
+        group.add_argument(
+            "--sniff",
+            action="store_true",
+            default=None,
+            help="skip files whose first bytes are not from a media file",
+        )
+
+
+class DirScan(object):
+    """State of a directory being enumerated"""
+
+    def __init__(self, path, mtime_ns, force=False, priority=SCAN, scope=None):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        # Rediscover every file below, even unchanged ones
+        self.force = force
+        # Scheduling class of the files found
+        self.priority = priority
+        # Rescan of a subtree the directory belongs to
+        self.scope = scope
+        self.children = 0
+        self.subdirs = set()
+
+
+class Rescan(object):
+    """State of a subtree rescan requested through the control socket"""
+
+    def __init__(self, path, generation):
+        self.path = path
+        # Files below stamped before are swept once every directory is done
+        self.generation = generation
+        # Directories below queued or being enumerated
+        self.numdirs = 0
+
+
+class Discovery(object):
+    """A file waiting for a discoverer, or being discovered"""
+
+    def __init__(self, uri, size, priority=SCAN, expected=None):
+        self.uri = uri
+        self.size = size
+        self.priority = priority
+        # Seconds the last discovery of the file took, if that matters to its
+        # timeout
+        self.expected = expected
+        self.queued = time.perf_counter()
+        # Number of previous attempts that timed out
+        self.attempt = 0
+        self.started = None
 
 
 class Discoverer(object):
@@ -62,89 +253,442 @@ class Discoverer(object):
         self.quit = args.quit
         self.dir = args.dir
         self.force = args.force
+        self.retry_errors = args.retry_errors
         self.signal_received = False
+        # Enumerate every directory, even unchanged ones
+        self.full_scan = False
         schema = Schema(config)
-        self.session = schema.create_session()
         # TODO Set the logging level
         # Write down the Meta table
-        meta = self.session.query(Meta).one_or_none()
+        session = schema.create_session()
+        meta = session.query(Meta).one_or_none()
         if not meta:
             meta = Meta()
             meta.version = __version__
             meta.root = self.dir
-            self.session.add(meta)
+            session.add(meta)
         else:
             meta.version = __version__
-        self.session.commit()
+        self.generation = meta.generation or 0
+        session.commit()
+        session.close()
+        # Unchanged files found by the current scan, not stamped yet
+        self.seen = []
+        self.sweep_pending = False
+        # Every batch gets its own session, closed once committed
+        self.persister = Persister(
+            schema.create_session,
+            config.get_database_batch_size(),
+            config.get_database_batch_timeout(),
+            self.on_commit_error,
+        )
+        # A batch was lost, scan again once idle, without trusting what the
+        # indexes and the directories say
+        self.rescan_pending = False
+        self.recovering = False
+        self.flush_source = None
+        self.store = InfoStore(
+            self.persister,
+            config.get_tags_allow(),
+            config.get_tags_deny(),
+            config.get_tags_max_size(),
+        )
+        self.cache = None
+        if config.get_cache_directory():
+            self.cache = InfoCache(config.get_cache_directory())
+        self.index = FileIndex()
+        self.dir_index = DirectoryIndex()
+        # Fingerprints of the files that failed, by file id
+        self.failed = {}
+        # Discovery times of the files slower than the base timeout, by file id
+        self.slow = {}
+        self.prefilter = Prefilter(
+            config.get_filter_include(),
+            config.get_filter_exclude(),
+            config.get_filter_extensions(),
+            config.get_filter_sniff(),
+        )
+        # Files being sniffed before being queued
+        self.sniffing = 0
         # TODO Check in case we have provided a different folder
         # Start analyzing the provided media path
         self.path = Gio.File.new_for_path(self.dir)
-        # Add a monitor
-        self.monitor = self.path.monitor_directory(0, None)
-        self.monitor.connect("changed", self.on_changed)
-        self.discoverer = GstPbutils.Discoverer.new(5 * Gst.SECOND)
-        self.discoverer.connect("discovered", self.on_discovered)
-        self.discoverer.connect("finished", self.on_finished)
+        # Files deleted from the monitor, by their (device, inode, size, mtime)
+        self.vanished = {}
+        self.vanished_source = None
+        # Monitor the whole tree, directories are added as they are scanned
+        self.watcher = Watcher(self, args.debounce, args.max_watches)
+        self.timeout = args.timeout
+        self.timeout_rate = args.timeout_rate
+        self.max_timeout = args.max_timeout
+        self.retries = args.retries
+        # Every discoverer probes one file at a time, so spread the files over
+        # as many of them as jobs requested. They all report back on this loop
+        self.discoverers = {}
+        for i in range(max(args.jobs, 1)):
+            self.add_discoverer()
+        # Files that timed out are retried on a discoverer of their own, so
+        # they do not hold the rest back
+        self.retry_discoverer = self.add_discoverer()
         self.numdiscoveries = 0
-        self.discoverer.start()
+        # Files waiting for a free discoverer, by priority. Enumerations are
+        # paused once the files they wait for reach the high-water mark and
+        # resumed at the low-water mark
+        self.scheduler = Scheduler(args.scan_share)
+        self.retry_queue = collections.deque()
+        # Files handed to a discoverer, by uri
+        self.discovering = {}
+        self.high_water = max(args.max_pending, 1)
+        self.low_water = self.high_water // 2
+        self.paused = []
+        # Subdirectories found but not enumerated yet, by priority, each one
+        # counted in numdirs
+        self.held_dirs = [collections.deque() for name in PRIORITY_NAMES]
+        self.open_dirs = 0
+        self.scan_batch = max(args.scan_batch, 1)
+        # Stop handing files to the discoverers, on request
+        self.discovery_paused = False
+        self.control = None
+        if args.control_socket:
+            self.control = ControlServer(self, args.control_socket)
+        self.register_gauges()
+        self.metrics_server = None
+        if args.metrics_port is not None:
+            self.metrics_server = MetricsServer(args.metrics_port)
         GLib.unix_signal_add(
             GLib.PRIORITY_HIGH, signal.SIGUSR1, self.on_usr1_signal, signal.SIGUSR1
         )
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            GLib.unix_signal_add(
+                GLib.PRIORITY_HIGH, signum, self.on_term_signal, signum
+            )
         self.scan_root()
 
-    def _has_gst_override(self):
-        # FIXME we need python3-gst-1.0 package to be installed in the virtualenv for
-        # unknown types (overrides). Sadly there is no pip package for it.
-        spec = importlib.util.find_spec("gi.overrides.Gst")
-        if spec:
-            return True
-        else:
-            return False
+    def register_gauges(self):
+        metrics.REGISTRY.gauge(
+            "flumes_scanning_dirs",
+            "Directories being scanned",
+            lambda: self.numdirs,
+        )
+        metrics.REGISTRY.gauge(
+            "flumes_pending_discoveries",
+            "Files found that are not discovered yet",
+            lambda: self.numdiscoveries,
+        )
+        metrics.REGISTRY.gauge(
+            "flumes_queue_depth",
+            "Files waiting for a free discoverer, or being sniffed",
+            self.queue_depth,
+        )
+        metrics.REGISTRY.gauge(
+            "flumes_pending_items",
+            "Items waiting to be committed",
+            lambda: self.persister.pending,
+        )
 
-    def _parse_type_value(self, s):
-        taglist = re.sub("(\{(?:\[??[^\[]*?\}))", "", s)
-        fields = taglist.split(",")
-        if len(fields) > 1:
-            regex = r"(?P<key>[\w-]*)\=\((?P<type>\w+)\)[\"]?(?P<value>[\w -\\]*)[\"]?"
-            regex_c = re.compile(regex)
-            # Remove trailing semicolon
-            for field in fields[1:-1] + [fields[-1][:-1]]:
-                groups = re.match(regex_c, field.strip())
-                yield (groups.group("key"), groups.group("type"), groups.group("value"))
+    @property
+    def session(self):
+        # The session of the current batch
+        return self.persister.session
 
     def rel_path(self, path):
         rel_path = os.path.relpath(path, self.path.get_path())
         (dirname, basename) = os.path.split(rel_path)
         return (dirname, basename)
 
-    def discover_file(self, path, mtime):
+    def add_discoverer(self):
+        # The timeout is set for every file before discovering it
+        discoverer = GstPbutils.Discoverer.new(int(self.timeout * Gst.SECOND))
+        discoverer.connect("discovered", self.on_discovered)
+        discoverer.connect("finished", self.on_finished)
+        discoverer.start()
+        self.discoverers[discoverer] = 0
+        return discoverer
+
+    def discovery_timeout(self, discovery):
+        # Reading a bigger file takes longer, and every retry doubles it
+        timeout = self.timeout + discovery.size / (self.timeout_rate * 2**20)
+        if discovery.expected:
+            timeout = max(timeout, discovery.expected * SLOW_FACTOR)
+        return min(timeout, self.max_timeout) * 2**discovery.attempt
+
+    @metrics.DISCOVER_FILE_SECONDS.time()
+    def discover_file(self, path, finfo, force=False, priority=SCAN):
         (dirname, basename) = self.rel_path(path)
-        (exists, needs_update) = self.file_stat(basename, dirname, mtime)
+        if not self.prefilter.accepts(os.path.join(dirname, basename)):
+            logger.debug("Skipping filtered %s", path)
+            return
+        fprint = fingerprint(finfo)
+        (exists, needs_update) = self.file_stat(basename, dirname, fprint)
         if not exists:
+            device = finfo.get_attribute_uint32(Gio.FILE_ATTRIBUTE_UNIX_DEVICE)
+            # Reuse the discovery of a moved file
+            if self.find_moved_file(basename, dirname, fprint, device):
+                return
             # Fill the File information
-            self.add_file(basename, dirname, mtime)
-        if needs_update or self.force or self.signal_received:
-            # Start discovering
-            uri = "file://{}".format(path)
-            logger.debug(
-                "Discovering {} (numdiscoveries: {})".format(uri, self.numdiscoveries)
-            )
+            self.add_file(basename, dirname, fprint, device)
+        elif needs_update:
+            self.update_file(basename, dirname, fprint)
+        else:
+            (file_id, ffprint) = self.index.get(dirname, basename)
+            self.stamp_file(file_id)
+            # Failed before and did not change since
+            if self.failed.get(file_id) == fprint and not self.retry_errors:
+                logger.debug("Skipping %s, its discovery failed", path)
+                return
+        if needs_update and not force and not self.force:
+            if self.restore_cached(basename, dirname, fprint):
+                return
+        if needs_update or force or self.force or self.signal_received:
             self.numdiscoveries += 1
-            self.discoverer.discover_uri_async(uri)
+            if self.prefilter.sniff:
+                self.sniffing += 1
+                self.prefilter.sniff_async(path, self.sniffed, fprint[0], priority)
+            else:
+                self.queue_discovery(path, fprint[0], priority)
 
-    def on_changed(self, monitor, f, of, event_type):
-        logger.debug(
-            "A change of type {} happened in the media directory".format(event_type)
+    def restore_cached(self, name, path, fprint):
+        # The same file was discovered before, like on a database that was
+        # lost, no need to run GStreamer on it again
+        if not self.cache:
+            return False
+        info = self.cache.get(fprint)
+        if not info:
+            return False
+        db_file = self.get_file(name, path)
+        try:
+            self.store.store(db_file, info)
+        except StructureError as e:
+            logger.error("Can not restore {}: {}".format(path, e))
+            return False
+        if db_file.error:
+            self.clear_error(db_file)
+        self.queue_flush()
+        logger.debug("Restored %s from the cache", os.path.join(path, name))
+        return True
+
+    def sniffed(self, path, media, size, priority):
+        # Called from the sniffing threads
+        GLib.idle_add(self.on_sniffed, path, media, size, priority)
+
+    def on_sniffed(self, path, media, size, priority):
+        self.sniffing -= 1
+        if media:
+            self.queue_discovery(path, size, priority)
+        else:
+            logger.debug("Skipping %s, not a media file", path)
+            self.discovery_done()
+            self.dispatch()
+        return False
+
+    def queue_discovery(self, path, size, priority):
+        # Start discovering
+        uri = "file://{}".format(path)
+        logger.debug("Discovering %s (numdiscoveries: %d)", uri, self.numdiscoveries)
+        entry = self.index.get(*self.rel_path(path))
+        expected = self.slow.get(entry[0]) if entry else None
+        self.scheduler.push(Discovery(uri, size, priority, expected), priority)
+        self.dispatch()
+
+    def queue_retry(self, discovery):
+        # Back off before trying again, doubling the wait on every attempt
+        discovery.attempt += 1
+        delay = RETRY_DELAY * 2 ** (discovery.attempt - 1)
+        logger.info(
+            "Discovery of {} timed out, retrying in {}s".format(discovery.uri, delay)
+        )
+        metrics.DISCOVERY_RETRIES.inc()
+        GLib.timeout_add(int(delay * 1000), self.on_retry, discovery)
+
+    def on_retry(self, discovery):
+        self.retry_queue.append(discovery)
+        self.dispatch()
+        return False
+
+    def queue_depth(self):
+        # Files being sniffed will be queued too
+        return len(self.scheduler) + self.sniffing
+
+    def start_discovery(self, discoverer, discovery):
+        self.discoverers[discoverer] += 1
+        discoverer.props.timeout = int(self.discovery_timeout(discovery) * Gst.SECOND)
+        discovery.started = time.perf_counter()
+        if discovery.priority == LIVE and not discovery.attempt:
+            metrics.LIVE_WAIT_SECONDS.observe(discovery.started - discovery.queued)
+        self.discovering[discovery.uri] = discovery
+        metrics.DISCOVERIES_STARTED.inc()
+        discoverer.discover_uri_async(discovery.uri)
+
+    def dispatch(self):
+        # Hand the queued files to the idle discoverers
+        for discoverer, pending in self.discoverers.items():
+            if not self.scheduler or self.discovery_paused:
+                break
+            if pending or discoverer == self.retry_discoverer:
+                continue
+            self.start_discovery(discoverer, self.scheduler.pop())
+        retry_pending = self.discoverers[self.retry_discoverer]
+        if self.retry_queue and not retry_pending and not self.discovery_paused:
+            self.start_discovery(self.retry_discoverer, self.retry_queue.popleft())
+
+        if self.paused:
+            paused = self.paused
+            self.paused = []
+            for (enum, state) in paused:
+                if self.pending(state.priority) > self.low_water:
+                    self.paused.append((enum, state))
+                    continue
+                logger.debug("Resuming {}".format(state.path or "root"))
+                self.next_files(enum, state)
+        if any(self.held_dirs):
+            self.release_dirs()
+
+    def file_moved(self, f, of):
+        (old_dirname, old_basename) = self.rel_path(f.get_path())
+        if not self.index.get(old_dirname, old_basename):
+            self.file_ready(of)
+            return
+        logger.debug("File {} moved to {}".format(f.get_path(), of.get_path()))
+        (dirname, basename) = self.rel_path(of.get_path())
+        self.move_file(old_basename, old_dirname, basename, dirname)
+
+    def file_ready(self, f):
+        logger.debug("File {} created".format(f.get_path()))
+        try:
+            finfo = f.query_info(
+                FILE_ATTRIBUTES, Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, None
+            )
+        except GLib.Error as e:
+            logger.debug("File {} is gone: {}".format(f.get_path(), e))
+            return
+        if finfo.get_file_type() == Gio.FileType.REGULAR:
+            self.discover_file(f.get_path(), finfo, priority=LIVE)
+
+    def dir_ready(self, f):
+        logger.debug("Directory {} created".format(f.get_path()))
+        self.scan_dir(f.get_path(), priority=LIVE)
+
+    def dir_moved(self, f, of):
+        logger.debug("Directory {} moved to {}".format(f.get_path(), of.get_path()))
+        old_path = self.rel_dir(f.get_path())
+        path = self.rel_dir(of.get_path())
+        for column in (File.path, Directory.path):
+            self.session.query(column.class_).filter(
+                self.dir_filter(column, old_path)
+            ).update(
+                {column: literal(path) + func.substr(column, len(old_path) + 1)},
+                synchronize_session=False,
+            )
+        self.index.move_dir(old_path, path)
+        self.dir_index.move_dir(old_path, path)
+        self.queue_flush()
+        # Watch the new location
+        self.scan_dir(of.get_path(), priority=LIVE)
+
+    def dir_vanished(self, f):
+        logger.debug("Directory {} deleted".format(f.get_path()))
+        path = self.rel_dir(f.get_path())
+        self.store.release_files(self.dir_filter(File.path, path))
+        self.session.query(File).filter(self.dir_filter(File.path, path)).delete(
+            synchronize_session=False
         )
-        if event_type == Gio.FileMonitorEvent.CREATED:
-            logger.debug("File {} created".format(f.get_path()))
-            finfo = f.query_info(Gio.FILE_ATTRIBUTE_TIME_MODIFIED, 0, None)
-            mtime = dateutil.parser.parse(
-                finfo.get_modification_date_time().format_iso8601()
+        self.index.remove_dir(path)
+        self.forget_dir(path)
+
+    def forget_dir(self, path):
+        self.session.query(Directory).filter(
+            self.dir_filter(Directory.path, path)
+        ).delete(synchronize_session=False)
+        self.dir_index.remove_dir(path)
+        self.queue_flush()
+
+    def store_dir(self, path, mtime_ns, children):
+        if self.dir_index.get(path) is None:
+            db_dir = Directory(
+                path=path,
+                mtime_ns=mtime_ns,
+                children=children,
+                generation=self.generation,
+            )
+            self.persister.add(db_dir)
+        else:
+            self.session.query(Directory).filter_by(path=path).update(
+                {
+                    "mtime_ns": mtime_ns,
+                    "children": children,
+                    "generation": self.generation,
+                },
+                synchronize_session=False,
+            )
+        self.dir_index.set(path, mtime_ns, children)
+        self.queue_flush()
+
+    def dir_filter(self, column, path):
+        # The entries in a directory and in every subdirectory
+        return or_(
+            column == path,
+            column.startswith(os.path.join(path, ""), autoescape=True),
+        )
+
+    def file_vanished(self, f):
+        # Keep the file for a while, if it appears again with the same identity
+        # it has been moved and its discovery can be reused
+        (dirname, basename) = self.rel_path(f.get_path())
+        db_file = self.get_file(basename, dirname)
+        if not db_file or db_file.inode is None:
+            self.delete_file(basename, dirname)
+            return
+        identity = (db_file.device, db_file.size, db_file.mtime_ns, db_file.inode)
+        self.vanished[identity] = (basename, dirname)
+        if not self.vanished_source:
+            self.vanished_source = GLib.timeout_add_seconds(
+                MOVE_TIMEOUT, self.on_vanished_timeout
+            )
+
+    def on_vanished_timeout(self):
+        self.vanished_source = None
+        self.expire_vanished()
+        return False
+
+    def expire_vanished(self):
+        vanished = self.vanished
+        self.vanished = {}
+        for (basename, dirname) in vanished.values():
+            # Replaced by a new file in the same place
+            if os.path.lexists(os.path.join(self.path.get_path(), dirname, basename)):
+                continue
+            self.delete_file(basename, dirname)
+
+    def find_moved_file(self, name, path, fprint, device):
+        identity = (device,) + fprint
+        moved = self.vanished.pop(identity, None)
+        if not moved:
+            # A file that was moved while not monitored, check if a known file
+            # with the same identity is not in its place anymore
+            found = self.index.find(fprint)
+            if not found:
+                return False
+            (old_path, old_name) = found
+            old = os.path.join(self.path.get_path(), old_path, old_name)
+            if os.path.lexists(old):
+                return False
+            # The fingerprint does not have the device
+            old_device = (
+                self.session.query(File.device)
+                .filter_by(name=old_name, path=old_path)
+                .scalar()
+            )
+            if old_device != device:
+                return False
+            moved = (old_name, old_path)
+        (old_name, old_path) = moved
+        logger.debug(
+            "File {} moved to {}".format(
+                os.path.join(old_path, old_name), os.path.join(path, name)
             )
-            self.discover_file(f.get_path(), mtime)
-        elif event_type == Gio.FileMonitorEvent.DELETED:
-            self.delete_file(f)
+        )
+        self.move_file(old_name, old_path, name, path)
+        return True
 
     def discovery_done(self):
         self.numdiscoveries -= 1
@@ -152,230 +696,467 @@ class Discoverer(object):
             logger.debug("No more discoveries")
         self.check_quit()
 
-    def dir_done(self):
-        self.numdirs -= 1
+    def dir_done(self, count=1):
+        self.numdirs -= count
         if not self.numdirs:
             logger.debug("No more dirs")
             self.signal_received = False
+            self.full_scan = False
+            self.recovering = False
+            if self.sweep_pending:
+                self.sweep()
         self.check_quit()
 
+    def stamp_file(self, file_id):
+        # Files not committed yet are already stamped
+        if file_id is None:
+            return
+        self.seen.append(file_id)
+        if len(self.seen) >= STAMP_BATCH:
+            self.stamp_seen()
+
+    def stamp_seen(self):
+        if not self.seen:
+            return
+        self.session.query(File).filter(File.id.in_(self.seen)).update(
+            {"generation": self.generation}, synchronize_session=False
+        )
+        self.seen = []
+        self.queue_flush()
+
+    def sweep(self):
+        # Remove the files the scan did not find. The ones in directories that
+        # were not enumerated because they did not change are still there
+        self.sweep_pending = False
+        removed = self.remove_stale(self.generation)
+        logger.info("Removed {} files not found by the scan".format(removed))
+
+    def sweep_scope(self, scope):
+        # The same for the files below a rescanned subtree, every directory
+        # below was enumerated
+        removed = self.remove_stale(
+            scope.generation, self.dir_filter(File.path, scope.path)
+        )
+        logger.info(
+            "Removed {} files not found by the rescan of {}".format(removed, scope.path)
+        )
+
+    def remove_stale(self, generation, *criteria):
+        self.stamp_seen()
+        cold = select(Directory.path).where(Directory.generation < generation)
+        stale = and_(File.generation < generation, File.path.not_in(cold), *criteria)
+        removed = self.session.query(File.path, File.name).filter(stale).all()
+        if removed:
+            self.store.release_files(stale)
+            self.session.query(File).filter(stale).delete(synchronize_session=False)
+            for (path, name) in removed:
+                self.index.remove(path, name)
+            removed = set(removed)
+            self.vanished = {
+                identity: (name, path)
+                for (identity, (name, path)) in self.vanished.items()
+                if (path, name) not in removed
+            }
+            self.queue_flush()
+        if self.store.sweep_blobs():
+            self.queue_flush()
+        return len(removed)
+
     def check_quit(self):
-        if not self.numdirs and not self.numdiscoveries and self.quit:
+        if self.numdirs or self.numdiscoveries:
+            return
+        if self.rescan_pending:
+            self.rescan_pending = False
+            self.recovering = True
+            self.scan_root()
+            return
+        if self.quit:
             self.stop()
 
-    def file_stat(self, name, path, mtime):
+    def on_commit_error(self, error):
+        # The indexes still have what the lost batch had
+        logger.warning("A batch was lost, rescanning once idle")
+        if not self.rescan_pending:
+            self.rescan_pending = True
+            GLib.idle_add(self.on_idle_rescan)
+
+    def on_idle_rescan(self):
+        self.check_quit()
+        return False
+
+    def forget_undiscovered(self):
+        # Files without an info nor an error, their discovery might have been
+        # lost with a batch
+        q = (
+            self.session.query(File.path, File.name, File.id)
+            .outerjoin(File.info)
+            .outerjoin(File.error)
+            .filter(Info.id.is_(None), Error.id.is_(None))
+        )
+        for (path, name, file_id) in q:
+            self.index.set(path, name, file_id, None)
+
+    def file_stat(self, name, path, fprint):
         # Check if a file exists in the database
-        f = self.get_file(name, path)
+        f = self.index.get(path, name)
         if not f:
             return (False, True)
-        # Make the mtime UTC otherwise the comparison will always fail
-        fmtime = f.mtime.replace(tzinfo=timezone.utc)
-        return (True, fmtime != mtime)
-
-    def add_file(self, name, path, mtime):
-        logger.debug("Adding file name={} path={} mtime={}".format(name, path, mtime))
-        db_file = File(name=name, path=path, mtime=mtime)
-        self.session.add(db_file)
-        self.session.commit()
-        return db_file
+        (file_id, ffprint) = f
+        return (True, ffprint != fprint)
 
-    def delete_file(self, f):
-        logger.debug("File {} deleted".format(f.get_path()))
-        (dirname, basename) = self.rel_path(f.get_path())
-        db_file = self.get_file(basename, dirname)
-        self.session.delete(db_file)
-        self.session.commit()
+    def file_columns(self, fprint, device=None):
+        (size, mtime_ns, inode) = fprint
+        columns = {
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "inode": inode,
+            "mtime": datetime.fromtimestamp(mtime_ns / 10**9, timezone.utc),
+            "generation": self.generation,
+        }
+        if device is not None:
+            columns["device"] = device
+        return columns
+
+    def add_file(self, name, path, fprint, device=None):
+        logger.debug("Adding file name=%s path=%s %s", name, path, fprint)
+        db_file = File(name=name, path=path, **self.file_columns(fprint, device))
+        self.persister.add(db_file)
+        self.index.set(path, name, None, fprint)
+        self.queue_flush()
         return db_file
 
-    def get_file(self, name, path):
-        db_file = self.session.query(File).filter_by(name=name, path=path).first()
+    def update_file(self, name, path, fprint):
+        logger.debug("Updating file name=%s path=%s %s", name, path, fprint)
+        self.session.query(File).filter_by(name=name, path=path).update(
+            self.file_columns(fprint), synchronize_session=False
+        )
+        (file_id, ffprint) = self.index.get(path, name)
+        self.index.set(path, name, file_id, fprint)
+        # The discovery might never come, if the file is not a media file
+        self.queue_flush()
+
+    def move_file(self, old_name, old_path, name, path):
+        # Replace whatever was on the destination
+        if self.index.get(path, name):
+            self.store.release_files(File.name == name, File.path == path)
+            self.session.query(File).filter_by(name=name, path=path).delete()
+            self.index.remove(path, name)
+        self.session.query(File).filter_by(name=old_name, path=old_path).update(
+            {"name": name, "path": path, "generation": self.generation}
+        )
+        (file_id, fprint) = self.index.get(old_path, old_name)
+        self.index.remove(old_path, old_name)
+        self.index.set(path, name, file_id, fprint)
+        self.queue_flush()
+
+    def delete_file(self, name, path):
+        logger.debug("File {} deleted".format(os.path.join(path, name)))
+        db_file = self.get_file(name, path)
+        self.index.remove(path, name)
+        if db_file:
+            self.store.release_files(File.id == db_file.id)
+            self.persister.delete(db_file)
+            self.queue_flush()
         return db_file
 
-    def store_stream_tags(self, db_stream, tags):
-        def store_tag(tl, tag, *user_data):
-            (copied, value) = Gst.TagList.copy_value(tl, tag)
-            if copied:
-                db_tag = Tag(stream=db_stream)
-                db_tag.name = tag
-                db_tag.value = Gst.value_serialize(value)
-                self.session.add(db_tag)
-
-        found = self._has_gst_override()
-        if found:
-            tags.foreach(store_tag, None)
-        else:
-            for (key, t, value) in self._parse_type_value(tags.to_string()):
-                db_tag = Tag(stream=db_stream)
-                db_tag.name = key
-                db_tag.value = value
-                self.session.add(db_tag)
-
-    def store_structure(self, db_stream, s):
-        def store_field(field_id, value, _unused):
-            # Add every GstStructure field
-            db_field = Field(stream=db_stream)
-            db_field.name = GLib.quark_to_string(field_id)
-            db_field.value = Gst.value_serialize(value)
-            self.session.add(db_field)
-            return True
+    def queue_flush(self):
+        # Account a unit of work and make sure a partial batch does not wait
+        # forever to be committed
+        self.persister.done()
+        if self.persister.pending and not self.flush_source:
+            self.flush_source = GLib.timeout_add(
+                self.persister.batch_timeout, self.on_flush_timeout
+            )
+
+    def on_flush_timeout(self):
+        self.flush_source = None
+        self.persister.flush()
+        return False
+
+    def flush(self):
+        if self.flush_source:
+            GLib.source_remove(self.flush_source)
+            self.flush_source = None
+        self.persister.flush()
 
-        found = self._has_gst_override()
-        if found:
-            s.foreach(store_field, None)
+    def store_error(self, db_file, kind, error_log):
+        # A single error per file, for the fingerprint that failed
+        fprint = (db_file.size, db_file.mtime_ns, db_file.inode)
+        db_error = db_file.error
+        if not db_error:
+            db_error = Error(file=db_file)
+            self.persister.add(db_error)
+        db_error.kind = kind
+        db_error.error_log = error_log
+        (db_error.size, db_error.mtime_ns, db_error.inode) = fprint
+        self.failed[db_file.id] = fprint
+
+    def clear_error(self, db_file):
+        # Deleted as an orphan, the control commands might have already
+        # forgotten the fingerprint
+        db_file.error = None
+        self.failed.pop(db_file.id, None)
+
+    def load_failed(self):
+        q = self.session.query(
+            Error.file_id, Error.size, Error.mtime_ns, Error.inode
+        ).filter(Error.size.is_not(None))
+        self.failed = {
+            file_id: (size, mtime_ns, inode) for (file_id, size, mtime_ns, inode) in q
+        }
+
+    def load_slow(self):
+        q = self.session.query(Info.file_id, Info.discovery_time).filter(
+            Info.discovery_time * SLOW_FACTOR > self.timeout
+        )
+        self.slow = {file_id: discovery_time for (file_id, discovery_time) in q}
+
+    def update_slow(self, db_file, discovery_time):
+        if discovery_time * SLOW_FACTOR > self.timeout:
+            self.slow[db_file.id] = discovery_time
         else:
-            for (key, t, value) in self._parse_type_value(s.to_string()):
-                db_field = Field(stream=db_stream)
-                db_field.name = key
-                db_field.value = value
-                self.session.add(db_field)
-
-    def store_stream_info(self, db_info, sinfo, parent=None):
-        if not sinfo:
-            return
+            self.slow.pop(db_file.id, None)
 
-        # Add the stream
-        if sinfo.__gtype__.name == "GstDiscovererContainerInfo":
-            db_stream = Container(info=db_info)
-        elif sinfo.__gtype__.name == "GstDiscovererVideoInfo":
-            db_stream = Video(info=db_info)
-            db_stream.bitrate = sinfo.get_bitrate()
-            db_stream.depth = sinfo.get_depth()
-            db_stream.framerate_denom = sinfo.get_framerate_denom()
-            db_stream.framerate_num = sinfo.get_framerate_num()
-            db_stream.height = sinfo.get_height()
-            db_stream.max_bitrate = sinfo.get_max_bitrate()
-            db_stream.par_denom = sinfo.get_par_denom()
-            db_stream.par_num = sinfo.get_par_num()
-            db_stream.width = sinfo.get_width()
-            db_stream.is_image = sinfo.is_image()
-            db_stream.is_interlaced = sinfo.is_interlaced()
-        elif sinfo.__gtype__.name == "GstDiscovererAudioInfo":
-            db_stream = Audio(info=db_info)
-            db_stream.channel_mask = sinfo.get_channel_mask()
-            db_stream.channels = sinfo.get_channels()
-            db_stream.sample_rate = sinfo.get_sample_rate()
-            db_stream.bitrate = sinfo.get_bitrate()
-            db_stream.max_bitrate = sinfo.get_max_bitrate()
-            db_stream.sample_rate = sinfo.get_sample_rate()
-            db_stream.depth = sinfo.get_depth()
-            db_stream.language = sinfo.get_language()
-        elif sinfo.__gtype__.name == "GstDiscovererSubtitleInfo":
-            db_stream = Subtitle(info=db_info)
-            db_stream.language = sinfo.get_language()
-        elif sinfo.__gtype__.name == "GstDiscovererStreamInfo":
-            db_stream = Stream(info=db_info)
-
-        # Common fields
-        if parent:
-            parent.children.append(db_stream)
-        s = sinfo.get_caps().get_structure(0)
-        db_stream.media_type = s.get_name()
-        self.session.add(db_stream)
-        # Now the fields
-        self.store_structure(db_stream, s)
-
-        # Now the tags
-        tags = sinfo.get_tags()
-        if tags:
-            self.store_stream_tags(db_stream, tags)
-
-        next_sinfo = sinfo.get_next()
-        if next_sinfo:
-            self.store_stream_info(db_info, next_sinfo)
-        elif sinfo.__gtype__.name == "GstDiscovererContainerInfo":
-            for s in sinfo.get_streams():
-                self.store_stream_info(db_info, s, db_stream)
+    def get_file(self, name, path):
+        db_file = self.session.query(File).filter_by(name=name, path=path).first()
+        return db_file
 
+    @metrics.ON_DISCOVERED_SECONDS.time()
     def on_discovered(self, discoverer, info, error):
-        logger.debug("Discovered {}".format(info.get_uri()))
+        logger.debug("Discovered %s", info.get_uri())
+        self.discoverers[discoverer] -= 1
         if not info:
+            self.dispatch()
             self.discovery_done()
             return
 
-        if type(error) == gi.repository.GLib.GError:
-            logger.error("With error {}".format(error))
-            path = urlparse(info.get_uri()).path
-            (dirname, basename) = self.rel_path(path)
-            file = self.session.query(File).filter(File.name == basename).first()
-            db_error = Error()
-            db_error.file_id = file.id
-            db_error.error_log = str(error)
-            try:
-                self.session.add(db_error)
-                self.session.commit()
-            except:
-                logger.error("Couldn't add error {} to the database".format(error))
-            finally:
-                self.session.close()
+        metrics.DISCOVERIES_COMPLETED.inc()
+        discovery = self.discovering.pop(info.get_uri(), None)
+        discovery_time = None
+        if discovery:
+            discovery_time = time.perf_counter() - discovery.started
+            metrics.DISCOVERY_SECONDS.observe(discovery_time)
+        result = info.get_result()
+        if result == GstPbutils.DiscovererResult.TIMEOUT:
+            metrics.DISCOVERY_TIMEOUTS.inc()
+            # Keep it pending until it is retried
+            if discovery and discovery.attempt < self.retries:
+                self.queue_retry(discovery)
+                self.dispatch()
+                return
+        self.dispatch()
 
         path = urlparse(info.get_uri()).path
         (dirname, basename) = self.rel_path(path)
 
-        result = info.get_result()
+        # Timeouts are recorded apart from the files that failed
+        kind = None
+        if result == GstPbutils.DiscovererResult.TIMEOUT:
+            kind = "timeout"
+            error_log = "Timed out after {:.1f}s".format(discovery_time or 0)
+        elif type(error) == gi.repository.GLib.GError:
+            kind = "error"
+            error_log = str(error)
+            metrics.DISCOVERY_ERRORS.inc()
+        if kind:
+            logger.error("Discovery of {} failed: {}".format(path, error_log))
+
         db_file = self.get_file(basename, dirname)
-        db_info = db_file.info
-        if not db_info:
-            db_info = Info(file=db_file)
-            self.session.add(db_info)
-
-        # Common properties
-        db_info.duration = info.get_duration()
-        db_info.live = info.get_live()
-        db_info.seekable = info.get_seekable()
-        # Number of streams
-        db_info.audio_streams = len(info.get_audio_streams())
-        db_info.video_streams = len(info.get_video_streams())
-        db_info.subtitle_streams = len(info.get_subtitle_streams())
-
-        # Topology
-        # Remove every previous stream
-        self.session.query(Stream).filter(Stream.info_id == db_info.id).delete()
-        self.session.commit()
-
-        sinfo = info.get_stream_info()
-        self.store_stream_info(db_info, sinfo)
-
-        # Finally commit
-        self.session.commit()
+        # The file might have been removed while being discovered
+        if db_file:
+            try:
+                self.store.store(db_file, info, discovery_time)
+            except StructureError as e:
+                kind = "error"
+                error_log = "Can not parse the discovery: {}".format(e)
+                logger.error("Discovery of {} failed: {}".format(path, error_log))
+                metrics.DISCOVERY_ERRORS.inc()
+            if kind:
+                self.store_error(db_file, kind, error_log)
+            elif db_file.error:
+                self.clear_error(db_file)
+            if discovery_time is not None and not kind:
+                self.update_slow(db_file, discovery_time)
+            entry = self.index.get(dirname, basename)
+            ok = result == GstPbutils.DiscovererResult.OK and not kind
+            if self.cache and entry and ok:
+                (file_id, fprint) = entry
+                self.cache.put(fprint, info)
+            # Finally queue the commit
+            self.queue_flush()
         self.discovery_done()
 
     def on_finished(self, discoverer):
         logger.debug("Finished")
 
-    def on_file_found(self, enum, res, user_data):
+    def pending(self, priority):
+        # The scan waits for every queued file, so changes and requests do not
+        # wait behind it, and those only for the files of their own class.
+        # Files being sniffed count for every class, they will be queued too
+        if priority == SCAN:
+            return self.queue_depth()
+        return self.scheduler.depth(priority) + self.sniffing
+
+    def scan_paused(self, priority):
+        return self.pending(priority) >= self.high_water
+
+    def on_file_found(self, enum, res, state):
         files = enum.next_files_finish(res)
         if not files:
+            if not state.path and not state.children and len(self.index):
+                # Most likely a filesystem that is not mounted, keep what is
+                # known until it is back
+                logger.warning(
+                    "The root is empty but {} files are known, skipping the "
+                    "sweep".format(len(self.index))
+                )
+                self.sweep_pending = False
+            else:
+                # Forget the subdirectories that are gone
+                for path in self.dir_index.children(state.path) - state.subdirs:
+                    self.forget_dir(path)
+                self.store_dir(state.path, state.mtime_ns, state.children)
+            self.open_dirs -= 1
+            self.release_dirs()
+            self.scope_done(state.scope)
             self.dir_done()
             return
 
+        state.children += len(files)
+        metrics.ENTRIES_ENUMERATED.inc(len(files))
         for f in files:
             file_type = f.get_file_type()
             if file_type == Gio.FileType.DIRECTORY:
                 # recurse
                 path = os.path.join(enum.get_container().get_path(), f.get_name())
-                subdir = Gio.File.new_for_path(path)
-                logger.debug("Recursing {} (numdirs: {})".format(path, self.numdirs))
-                self.numdirs += 1
-                subdir.enumerate_children_async(
-                    "*",
-                    Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS,
-                    0,
-                    None,
-                    self.on_directory_content,
-                    None,
-                )
+                state.subdirs.add(os.path.join(state.path, f.get_name()))
+                (size, mtime_ns, inode) = fingerprint(f)
+                self.queue_dir(path, mtime_ns, state.force, state.priority, state.scope)
             elif file_type == Gio.FileType.REGULAR:
                 path = os.path.join(enum.get_container().get_path(), f.get_name())
-                mtime = dateutil.parser.parse(
-                    f.get_modification_date_time().format_iso8601()
+                self.discover_file(path, f, state.force, state.priority)
+
+        self.next_files(enum, state)
+
+    def on_directory_content(self, path, res, state):
+        try:
+            enum = path.enumerate_children_finish(res)
+        except GLib.Error as e:
+            logger.warning("Can not scan {}: {}".format(path.get_path(), e))
+            self.open_dirs -= 1
+            self.release_dirs()
+            self.scope_done(state.scope)
+            self.dir_done()
+            return
+        self.next_files(enum, state)
+
+    def rel_dir(self, path):
+        rel_path = os.path.relpath(path, self.path.get_path())
+        return "" if rel_path == "." else rel_path
+
+    def scan_dir(self, path, mtime_ns=None, force=False, priority=SCAN, scope=None):
+        if mtime_ns is None:
+            try:
+                finfo = Gio.File.new_for_path(path).query_info(
+                    FILE_ATTRIBUTES, Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, None
+                )
+            except GLib.Error as e:
+                logger.warning("Can not scan {}: {}".format(path, e))
+                self.scope_done(scope)
+                return
+            (size, mtime_ns, inode) = fingerprint(finfo)
+
+        rel_path = self.rel_dir(path)
+        known = self.dir_index.get(rel_path)
+        if (
+            known
+            and known[0] == mtime_ns
+            and not force
+            and not self.force
+            and not scope
+            and not self.full_scan
+            and not self.signal_received
+            and not self.recovering
+        ):
+            self.skip_dir(path, rel_path, priority)
+            return
+
+        logger.debug("Recursing %s (numdirs: %d)", path, self.numdirs)
+        self.watcher.watch(path)
+        self.numdirs += 1
+        self.open_dirs += 1
+        Gio.File.new_for_path(path).enumerate_children_async(
+            FILE_ATTRIBUTES,
+            Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS,
+            0,
+            None,
+            self.on_directory_content,
+            DirScan(rel_path, mtime_ns, force, priority, scope),
+        )
+
+    def scope_done(self, scope):
+        if not scope:
+            return
+        scope.numdirs -= 1
+        if not scope.numdirs:
+            self.sweep_scope(scope)
+
+    def skip_dir(self, path, rel_path, priority=SCAN):
+        # No entry was added, removed or renamed since the last scan, only the
+        # subdirectories need to be checked. Files modified in place do not
+        # change the mtime of their directory, those are found by the watcher
+        # or by forced scans
+        logger.debug("Skipping unchanged %s", path)
+        self.watcher.watch(path)
+        for subdir in list(self.dir_index.children(rel_path)):
+            self.queue_dir(
+                os.path.join(self.path.get_path(), subdir), None, priority=priority
+            )
+
+    def next_files(self, enum, state):
+        if self.scan_paused(state.priority):
+            logger.debug(
+                "Pausing {} (pending: {})".format(
+                    state.path or "root", self.pending(state.priority)
                 )
-                self.discover_file(path, mtime)
+            )
+            self.paused.append((enum, state))
+            return
+        enum.next_files_async(self.scan_batch, 0, None, self.on_file_found, state)
 
-        enum.next_files_async(1, 0, None, self.on_file_found, None)
+    def queue_dir(self, path, mtime_ns, force=False, priority=SCAN, scope=None):
+        # Enumerate a subdirectory once there is room for it
+        if scope:
+            scope.numdirs += 1
+        if (
+            self.held_dirs[priority]
+            or self.open_dirs >= MAX_OPEN_DIRS
+            or self.scan_paused(priority)
+        ):
+            self.numdirs += 1
+            self.held_dirs[priority].append((path, mtime_ns, force, scope))
+            return
+        self.scan_dir(path, mtime_ns, force, priority, scope)
+
+    def release_dirs(self):
+        released = 0
+        for (priority, held) in enumerate(self.held_dirs):
+            while (
+                held
+                and self.open_dirs < MAX_OPEN_DIRS
+                and not self.scan_paused(priority)
+            ):
+                (path, mtime_ns, force, scope) = held.popleft()
+                self.scan_dir(path, mtime_ns, force, priority, scope)
+                released += 1
+        # Done with the reference each one held, once it is scanning
+        if released:
+            self.dir_done(released)
 
-    def on_directory_content(self, path, res, user_data):
-        enum = path.enumerate_children_finish(res)
-        enum.next_files_async(1, 0, None, self.on_file_found, None)
+    def on_term_signal(self, signum):
+        logger.debug("Signal {} received, stopping".format(signum))
+        self.stop()
+        return False
 
     def on_usr1_signal(self, signum):
         if self.numdirs or self.numdiscoveries:
@@ -387,22 +1168,145 @@ class Discoverer(object):
             return True
 
     def scan_root(self):
-        # Iterate over the files in the directory
-        self.numdirs = 1
-        self.path.enumerate_children_async(
-            "*",
-            Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS,
-            0,
-            None,
-            self.on_directory_content,
-            None,
+        # Take a snapshot of the known files, so checking every file found does
+        # not need a query
+        self.index.load(self.session)
+        logger.debug("Loaded {} files from the database".format(len(self.index)))
+        self.dir_index.load(self.session)
+        self.load_failed()
+        self.load_slow()
+        if self.recovering:
+            self.forget_undiscovered()
+        # Stamp everything found with a new generation, the rest is swept once
+        # the whole tree has been scanned
+        self.generation += 1
+        self.session.query(Meta).update(
+            {"generation": self.generation}, synchronize_session=False
         )
+        self.queue_flush()
+        self.sweep_pending = True
+        # Iterate over the files in the directory, holding a reference in case
+        # every directory is unchanged and none is enumerated
+        self.numdirs = 1
+        self.scan_dir(self.path.get_path())
+        self.dir_done()
+
+    def control_path(self, path):
+        # Paths are relative to the root, and can not leave it
+        root = self.path.get_path()
+        full = os.path.normpath(os.path.join(root, path))
+        if full != root and not full.startswith(os.path.join(root, "")):
+            raise ControlError("{} is outside of {}".format(path, root))
+        return full
+
+    def control_status(self):
+        return {
+            "numdirs": self.numdirs,
+            "numdiscoveries": self.numdiscoveries,
+            "queue": len(self.scheduler),
+            "queues": self.scheduler.depths(),
+            "retry_queue": len(self.retry_queue),
+            "sniffing": self.sniffing,
+            "paused_dirs": len(self.paused),
+            "held_dirs": sum(len(held) for held in self.held_dirs),
+            "discovery_paused": self.discovery_paused,
+            "generation": self.generation,
+        }
+
+    def control_rescan(self, path="", force=False):
+        # Every directory is enumerated, only the files whose fingerprint
+        # changed are discovered again unless forced
+        full = self.control_path(path)
+        if full == self.path.get_path():
+            # Forced, the same as SIGUSR1
+            if self.numdirs or self.numdiscoveries:
+                raise ControlError("Currently scanning")
+            self.full_scan = True
+            self.signal_received = bool(force)
+            self.scan_root()
+            return {}
+        if not os.path.isdir(full):
+            raise ControlError("{} is not a directory".format(path))
+        # A scan of the whole tree in progress already has a generation of
+        # its own, a new one would have it sweep what it stamped so far
+        if not self.sweep_pending:
+            self.generation += 1
+            self.session.query(Meta).update(
+                {"generation": self.generation}, synchronize_session=False
+            )
+            self.queue_flush()
+        scope = Rescan(self.rel_dir(full), self.generation)
+        self.numdirs += 1
+        scope.numdirs += 1
+        self.scan_dir(full, force=bool(force), priority=REQUEST, scope=scope)
+        self.dir_done()
+        return {}
+
+    def control_discover(self, path):
+        full = self.control_path(path)
+        try:
+            finfo = Gio.File.new_for_path(full).query_info(
+                FILE_ATTRIBUTES, Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, None
+            )
+        except GLib.Error as e:
+            raise ControlError("Can not discover {}: {}".format(path, e))
+        if finfo.get_file_type() != Gio.FileType.REGULAR:
+            raise ControlError("{} is not a regular file".format(path))
+        numdiscoveries = self.numdiscoveries
+        # An explicit request skips the failed files cache
+        entry = self.index.get(*self.rel_path(full))
+        if entry:
+            self.failed.pop(entry[0], None)
+        self.discover_file(full, finfo, force=True, priority=REQUEST)
+        return {"queued": self.numdiscoveries > numdiscoveries}
+
+    def control_metrics(self):
+        return {"metrics": metrics.REGISTRY.render()}
+
+    def control_retry_errors(self):
+        # Discover again every file that failed
+        failed = self.session.query(File.path, File.name).join(File.error).all()
+        self.failed = {}
+        for (path, name) in failed:
+            full = os.path.join(self.path.get_path(), path, name)
+            try:
+                finfo = Gio.File.new_for_path(full).query_info(
+                    FILE_ATTRIBUTES, Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, None
+                )
+            except GLib.Error as e:
+                logger.debug("File {} is gone: {}".format(full, e))
+                continue
+            self.discover_file(full, finfo, force=True, priority=REQUEST)
+        return {"files": len(failed)}
+
+    def control_pause(self):
+        self.discovery_paused = True
+        return {}
+
+    def control_resume(self):
+        self.discovery_paused = False
+        self.dispatch()
+        return {}
 
     def start(self):
         self.loop.run()
 
     def stop(self):
-        self.discoverer.stop()
+        if self.control:
+            self.control.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+        self.watcher.stop()
+        self.prefilter.stop()
+        for discoverer in self.discoverers:
+            discoverer.stop()
+        if self.vanished_source:
+            GLib.source_remove(self.vanished_source)
+            self.vanished_source = None
+        self.expire_vanished()
+        # Make sure every pending item reaches the database
+        self.flush()
         self.loop.quit()
 
 
@@ -0,0 +1,141 @@
+import os
+import sys
+
+from .schema import Directory, File
+
+
+class FileIndex(object):
+    """In-memory snapshot of the files table
+
+    Entries are kept per directory, with the directory names interned, so a
+    library of millions of files only holds every dirname once. Each entry
+    maps a file name to its `(id, fingerprint)`; the id is None for files
+    that have been added but not committed yet. The files can also be found
+    by fingerprint, through a map only built on the first lookup.
+    """
+
+    def __init__(self):
+        self.dirs = {}
+        self.count = 0
+        self.fingerprints = None
+
+    def load(self, session):
+        self.dirs = {}
+        self.count = 0
+        self.fingerprints = None
+        q = session.query(
+            File.path, File.name, File.id, File.size, File.mtime_ns, File.inode
+        )
+        for (path, name, id, size, mtime_ns, inode) in q.yield_per(10000):
+            self.set(path, name, id, (size, mtime_ns, inode))
+
+    def get(self, path, name):
+        files = self.dirs.get(path)
+        if files is None:
+            return None
+        return files.get(name)
+
+    def set(self, path, name, id, fingerprint):
+        files = self.dirs.get(path)
+        if files is None:
+            files = self.dirs[sys.intern(path)] = {}
+        if name not in files:
+            self.count += 1
+        files[name] = (id, fingerprint)
+        if self.fingerprints is not None and fingerprint:
+            self.fingerprints[fingerprint] = (path, name)
+
+    def find(self, fingerprint):
+        # The `(path, name)` of a file with that fingerprint
+        if self.fingerprints is None:
+            self.fingerprints = {
+                fprint: (path, name)
+                for (path, files) in self.dirs.items()
+                for (name, (id, fprint)) in files.items()
+                if fprint
+            }
+        found = self.fingerprints.get(fingerprint)
+        if not found:
+            return None
+        # Entries are not removed from the map, check it is still there
+        entry = self.get(*found)
+        if not entry or entry[1] != fingerprint:
+            del self.fingerprints[fingerprint]
+            return None
+        return found
+
+    def remove(self, path, name):
+        files = self.dirs.get(path)
+        if files is None or name not in files:
+            return
+        del files[name]
+        self.count -= 1
+        if not files:
+            del self.dirs[path]
+
+    def subdirs(self, path):
+        prefix = path + "/"
+        return [p for p in self.dirs if p == path or p.startswith(prefix)]
+
+    def move_dir(self, old_path, path):
+        for p in self.subdirs(old_path):
+            self.dirs[sys.intern(path + p[len(old_path) :])] = self.dirs.pop(p)
+        self.fingerprints = None
+
+    def remove_dir(self, path):
+        for p in self.subdirs(path):
+            self.count -= len(self.dirs.pop(p))
+        self.fingerprints = None
+
+    def __len__(self):
+        return self.count
+
+
+class DirectoryIndex(object):
+    """In-memory snapshot of the directories table
+
+    Maps every directory to its `(mtime_ns, children)` and keeps the tree of
+    known subdirectories, so unchanged directories can be walked without
+    being enumerated.
+    """
+
+    def __init__(self):
+        self.dirs = {}
+        self.tree = {}
+
+    def load(self, session):
+        self.dirs = {}
+        self.tree = {}
+        q = session.query(Directory.path, Directory.mtime_ns, Directory.children)
+        for (path, mtime_ns, children) in q.yield_per(10000):
+            self.set(path, mtime_ns, children)
+
+    def get(self, path):
+        return self.dirs.get(path)
+
+    def set(self, path, mtime_ns, children):
+        if path not in self.dirs and path:
+            parent = os.path.dirname(path)
+            self.tree.setdefault(parent, set()).add(path)
+        self.dirs[path] = (mtime_ns, children)
+
+    def children(self, path):
+        return self.tree.get(path, set())
+
+    def subdirs(self, path):
+        prefix = path + "/"
+        return [p for p in self.dirs if p == path or p.startswith(prefix)]
+
+    def move_dir(self, old_path, path):
+        entries = [(p, self.dirs[p]) for p in self.subdirs(old_path)]
+        self.remove_dir(old_path)
+        for (p, (mtime_ns, children)) in entries:
+            self.set(path + p[len(old_path) :], mtime_ns, children)
+
+    def remove_dir(self, path):
+        for p in self.subdirs(path):
+            del self.dirs[p]
+            self.tree.pop(p, None)
+        siblings = self.tree.get(os.path.dirname(path))
+        if siblings:
+            siblings.discard(path)
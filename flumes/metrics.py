@@ -0,0 +1,203 @@
+"""Counters and histograms of the indexer, in the Prometheus text format
+
+The metrics are module globals, updated from the main loop, and rendered by
+`Registry.render()`, either from the HTTP endpoint of `MetricsServer` or on
+demand, like the `metrics` control command does.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Seconds, the default buckets of the Prometheus clients
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BATCH_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 5000)
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Counter(object):
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        return [(self.name, "", self.value)]
+
+
+class Gauge(object):
+    """A value read when rendered"""
+
+    def __init__(self, name, documentation, read):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def samples(self):
+        return [(self.name, "", self.read())]
+
+
+class Histogram(object):
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self):
+        samples = []
+        cumulative = 0
+        for (bound, count) in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append(
+                (
+                    "{}_bucket".format(self.name),
+                    '{{le="{}"}}'.format(format_value(bound)),
+                    cumulative,
+                )
+            )
+        samples.append(("{}_sum".format(self.name), "", self.sum))
+        samples.append(("{}_count".format(self.name), "", self.count))
+        return samples
+
+
+class Registry(object):
+    TYPES = {Counter: "counter", Gauge: "gauge", Histogram: "histogram"}
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        # Registering a name again replaces it, as a new Discoverer does with
+        # its gauges
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation):
+        return self.register(Counter(name, documentation))
+
+    def gauge(self, name, documentation, read):
+        return self.register(Gauge(name, documentation, read))
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, buckets))
+
+    def render(self):
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append("# HELP {} {}".format(metric.name, metric.documentation))
+            lines.append("# TYPE {} {}".format(metric.name, self.TYPES[type(metric)]))
+            for (name, labels, value) in metric.samples():
+                lines.append("{}{} {}".format(name, labels, format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+ENTRIES_ENUMERATED = REGISTRY.counter(
+    "flumes_entries_enumerated_total", "Directory entries read by the scan"
+)
+DISCOVERIES_STARTED = REGISTRY.counter(
+    "flumes_discoveries_started_total", "Files handed to a discoverer"
+)
+DISCOVERIES_COMPLETED = REGISTRY.counter(
+    "flumes_discoveries_completed_total", "Files discovered, with or without errors"
+)
+DISCOVERY_TIMEOUTS = REGISTRY.counter(
+    "flumes_discovery_timeouts_total", "Discoveries that timed out"
+)
+DISCOVERY_RETRIES = REGISTRY.counter(
+    "flumes_discovery_retries_total", "Discoveries retried after a timeout"
+)
+DISCOVERY_ERRORS = REGISTRY.counter(
+    "flumes_discovery_errors_total", "Discoveries that failed"
+)
+DISCOVERY_SECONDS = REGISTRY.histogram(
+    "flumes_discovery_seconds", "Time from handing a file to a discoverer to its result"
+)
+LIVE_WAIT_SECONDS = REGISTRY.histogram(
+    "flumes_live_wait_seconds", "Time a changed file waits for a discoverer"
+)
+DISCOVER_FILE_SECONDS = REGISTRY.histogram(
+    "flumes_discover_file_seconds", "Time to check a file found by the scan"
+)
+ON_DISCOVERED_SECONDS = REGISTRY.histogram(
+    "flumes_on_discovered_seconds", "Time to handle a discovery result"
+)
+STORE_STREAM_INFO_SECONDS = REGISTRY.histogram(
+    "flumes_store_stream_info_seconds", "Time to walk the streams of a discovery"
+)
+COMMIT_SECONDS = REGISTRY.histogram(
+    "flumes_commit_seconds", "Time to commit a batch to the database"
+)
+COMMIT_BATCH_SIZE = REGISTRY.histogram(
+    "flumes_commit_batch_size", "Items committed at once", BATCH_BUCKETS
+)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(
+            "Metrics request from %s: %s", self.address_string(), format % args
+        )
+
+
+class MetricsServer(object):
+    """Serves /metrics on localhost, from a thread of its own"""
+
+    def __init__(self, port, registry=REGISTRY):
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="metrics", daemon=True
+        )
+        self.thread.start()
+        logger.info(
+            "Serving metrics on http://127.0.0.1:{}/metrics".format(
+                self.server.server_address[1]
+            )
+        )
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
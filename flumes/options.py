@@ -1,5 +1,7 @@
 from argparse import ArgumentParser
 
+from .config import Config
+
 
 class Options(ArgumentParser):
     def __init__(self, *args, **kwargs):
@@ -18,3 +20,74 @@ class Options(ArgumentParser):
         group.add_argument("-o", "--host", action="store", help="database host")
         group.add_argument("-r", "--port", action="store", help="database port")
         group.add_argument("-b", "--database", action="store", help="database")
+        group.add_argument(
+            "--batch-size",
+            action="store",
+            type=int,
+            help="number of items to commit at once",
+        )
+        group.add_argument(
+            "--batch-timeout",
+            action="store",
+            type=int,
+            help="milliseconds to wait before committing a partial batch",
+        )
+        group = self.add_argument_group("sqlite")
+        group.add_argument(
+            "--journal-mode",
+            action="store",
+            type=str.upper,
+            choices=Config.conf_sqlite_choices["journal_mode"],
+            help="journal mode (default: WAL)",
+        )
+        group.add_argument(
+            "--synchronous",
+            action="store",
+            type=str.upper,
+            choices=Config.conf_sqlite_choices["synchronous"],
+            help="synchronous mode (default: NORMAL)",
+        )
+        group.add_argument(
+            "--mmap-size", action="store", type=int, help="memory mapped I/O bytes"
+        )
+        group.add_argument(
+            "--cache-size",
+            action="store",
+            type=int,
+            help="page cache size, in pages or in KiB if negative",
+        )
+        group.add_argument(
+            "--temp-store",
+            action="store",
+            type=str.upper,
+            choices=Config.conf_sqlite_choices["temp_store"],
+            help="temporary tables storage",
+        )
+        group.add_argument(
+            "--busy-timeout",
+            action="store",
+            type=int,
+            help="milliseconds to wait on a locked database",
+        )
+        group = self.add_argument_group("cache")
+        group.add_argument(
+            "--cache", action="store", help="discovery results cache directory"
+        )
+        group = self.add_argument_group("tags")
+        group.add_argument(
+            "--tags-allow",
+            action="store",
+            help="comma separated list of the only tags to store",
+        )
+        group.add_argument(
+            "--tags-deny",
+            action="store",
+            help="comma separated list of tags not to store",
+        )
+        group.add_argument(
+            "--tags-max-size",
+            action="store",
+            type=int,
+            help="bytes of a tag value to move it to the blob store, 0 to disable "
+            "(default: {})".format(Config.DEFAULT_TAG_MAX_SIZE),
+        )
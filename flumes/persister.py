@@ -0,0 +1,71 @@
+import logging
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Persister(object):
+    """Write-behind stage with a session per batch
+
+    Objects are added to the session right away but the transaction is only
+    committed once `batch_size` units of work have been queued, or when the
+    owner calls `flush` (on a timer, or before quitting). The session is then
+    closed, so nothing loaded by a batch outlives it, and a new one is created
+    on demand by `create_session` for the next batch.
+
+    A batch that can not be committed is rolled back and lost. `on_error` is
+    then called with the error, for the owner to find the lost work again,
+    and without it the error is raised.
+    """
+
+    def __init__(self, create_session, batch_size=1, batch_timeout=0, on_error=None):
+        self.create_session = create_session
+        self.batch_size = max(batch_size, 1)
+        self.batch_timeout = batch_timeout
+        self.on_error = on_error
+        self.pending = 0
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = self.create_session()
+        return self._session
+
+    def add(self, obj):
+        self.session.add(obj)
+
+    def delete(self, obj):
+        self.session.delete(obj)
+
+    def done(self):
+        # One more unit of work (a file, a discovery result) is in the session
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._session is None:
+            return
+        if self.pending:
+            logger.debug("Committing %d pending items", self.pending)
+        metrics.COMMIT_BATCH_SIZE.observe(self.pending)
+        error = None
+        try:
+            with metrics.COMMIT_SECONDS.time():
+                self._session.commit()
+        except SQLAlchemyError as e:
+            logger.error("Couldn't commit {} items: {}".format(self.pending, e))
+            self._session.rollback()
+            error = e
+        finally:
+            self._session.close()
+            self._session = None
+            self.pending = 0
+        if error:
+            if not self.on_error:
+                raise error
+            self.on_error(error)
@@ -0,0 +1,141 @@
+import codecs
+import fnmatch
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from the beginning of a file to sniff its type
+SNIFF_SIZE = 4096
+SNIFF_WORKERS = 4
+# Signatures of files that are never media
+NON_MEDIA_MAGIC = [
+    b"SQLite format 3\x00",
+    b"PK\x03\x04",
+    b"%PDF-",
+    b"\x7fELF",
+    b"\x1f\x8b",
+    b"BZh",
+    b"\xfd7zXZ\x00",
+    b"7z\xbc\xaf\x27\x1c",
+    b"Rar!\x1a\x07",
+    b"MSCF",
+    b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1",
+]
+# Text files that can still be discovered, as subtitles or playlists
+TEXT_MEDIA_MAGIC = [
+    b"WEBVTT",
+    b"[Script Info]",
+    b"#EXTM3U",
+    b"<?xml",
+    b"<smil",
+    b"<SAMI",
+    b"<sami",
+    b"[playlist]",
+]
+TEXT_MEDIA_MARKERS = re.compile(
+    # SubRip timings, and MicroDVD and MPL2 frames or deciseconds
+    rb"-->|^\{\d+\}\{\d*\}|^\[\d+\]\[\d*\]",
+    re.MULTILINE,
+)
+# Text files with these extensions are never rejected
+TEXT_MEDIA_EXTENSIONS = {
+    "ass",
+    "m3u",
+    "m3u8",
+    "mpl",
+    "pls",
+    "sami",
+    "smi",
+    "srt",
+    "ssa",
+    "sub",
+    "vtt",
+}
+
+
+def compile_globs(globs):
+    if not globs:
+        return None
+    return re.compile("|".join(fnmatch.translate(g) for g in globs))
+
+
+def sniff(path):
+    """Tells if a file can be media, by its first bytes
+
+    Only obvious non media files are rejected: empty files, archives,
+    databases, documents and executables, and plain text files that are not
+    subtitles or playlists, by their extension or their content.
+    """
+    try:
+        with open(path, "rb") as f:
+            head = f.read(SNIFF_SIZE)
+    except OSError as e:
+        # Let the discovery report it
+        logger.debug("Can not sniff {}: {}".format(path, e))
+        return True
+    if not head:
+        return False
+    if head.startswith(b"\xef\xbb\xbf"):
+        head = head[3:]
+    if any(head.startswith(magic) for magic in NON_MEDIA_MAGIC):
+        return False
+    if b"\x00" in head:
+        return True
+    try:
+        # Not final, a multibyte character might be cut at the end
+        codecs.getincrementaldecoder("utf-8")().decode(head)
+    except UnicodeDecodeError:
+        return True
+    if os.path.splitext(path)[1][1:].lower() in TEXT_MEDIA_EXTENSIONS:
+        return True
+    text = head.lstrip()
+    if any(text.startswith(magic) for magic in TEXT_MEDIA_MAGIC):
+        return True
+    return bool(TEXT_MEDIA_MARKERS.search(text))
+
+
+class Prefilter(object):
+    """Decides which files are worth a discovery
+
+    Files are first checked by name, against the allowed `extensions` and
+    the `include` and `exclude` globs, matched with the path relative to
+    the root or with the file name. Then, when `sniff` is set, the first
+    bytes of the file are checked in a thread pool.
+    """
+
+    def __init__(self, include=None, exclude=None, extensions=None, sniff=False):
+        self.include = compile_globs(include)
+        self.exclude = compile_globs(exclude)
+        self.extensions = set(e.lower().lstrip(".") for e in extensions or [])
+        self.sniff = sniff
+        self.executor = None
+
+    def accepts(self, path):
+        name = os.path.basename(path)
+        if self.extensions:
+            ext = os.path.splitext(name)[1][1:].lower()
+            if ext not in self.extensions:
+                return False
+        if self.include:
+            if not self.include.match(path) and not self.include.match(name):
+                return False
+        if self.exclude:
+            if self.exclude.match(path) or self.exclude.match(name):
+                return False
+        return True
+
+    def sniff_async(self, path, callback, *args):
+        # The callback is called from the pool, with the path, whether the
+        # file can be media and the args
+        if not self.executor:
+            self.executor = ThreadPoolExecutor(SNIFF_WORKERS, "sniff")
+        future = self.executor.submit(sniff, path)
+        future.add_done_callback(lambda f: callback(path, f.result(), *args))
+
+    def stop(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
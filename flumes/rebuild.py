@@ -0,0 +1,73 @@
+import logging
+import sys
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import Gst
+
+from .cache import InfoCache
+from .config import Config
+from .options import Options
+from .persister import Persister
+from .schema import File, Schema
+from .store import InfoStore
+from .structure import StructureError
+
+logging.basicConfig(stream=sys.stdout, level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class Rebuilder(object):
+    def __init__(self, config):
+        Gst.init(None)
+
+        schema = Schema(config)
+        self.persister = Persister(
+            schema.create_session, config.get_database_batch_size()
+        )
+        self.store = InfoStore(
+            self.persister,
+            config.get_tags_allow(),
+            config.get_tags_deny(),
+            config.get_tags_max_size(),
+        )
+        self.cache = InfoCache(config.get_cache_directory())
+
+    def rebuild(self):
+        session = self.persister.session
+        files = session.query(File.id, File.size, File.mtime_ns, File.inode).all()
+        restored = 0
+        for (file_id, size, mtime_ns, inode) in files:
+            info = self.cache.get((size, mtime_ns, inode))
+            if not info:
+                continue
+            # Each batch has its own session
+            db_file = self.persister.session.get(File, file_id)
+            try:
+                self.store.store(db_file, info)
+            except StructureError as e:
+                logger.error("Can not restore file {}: {}".format(file_id, e))
+                continue
+            self.persister.done()
+            restored += 1
+        self.persister.flush()
+        logger.info(
+            "Restored {} of {} files from the cache".format(restored, len(files))
+        )
+        return restored
+
+
+def run():
+    options = Options(description="Rebuild the discovery results from the cache")
+    args = options.parse_args()
+    # Read the config file
+    config = Config(args)
+    if not config.get_cache_directory():
+        options.error("A cache directory is required")
+    rebuilder = Rebuilder(config)
+    rebuilder.rebuild()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,48 @@
+import collections
+
+# Priority classes, in the order they are served
+LIVE = 0
+REQUEST = 1
+SCAN = 2
+PRIORITY_NAMES = ["live", "request", "scan"]
+
+
+class Scheduler(object):
+    """Queues of files waiting for a discoverer, by priority class
+
+    Files found by the watcher (LIVE) go before files explicitly requested
+    (REQUEST), which go before the ones found by a scan (SCAN). So a scan
+    still makes progress while changes keep coming, it gets `scan_share` of
+    the dispatches whenever there is other work waiting.
+    """
+
+    def __init__(self, scan_share=0.1):
+        self.scan_share = min(max(scan_share, 0), 1)
+        self.queues = [collections.deque() for name in PRIORITY_NAMES]
+        # Dispatches owed to the scan, one is taken once it reaches 1
+        self.credit = 0
+
+    def __len__(self):
+        return sum(len(q) for q in self.queues)
+
+    def push(self, item, priority=SCAN):
+        self.queues[priority].append(item)
+
+    def pop(self):
+        scan = self.queues[SCAN]
+        urgent = next((q for q in self.queues[:SCAN] if q), None)
+        if not urgent:
+            self.credit = 0
+            return scan.popleft()
+        if scan and self.credit >= 1:
+            self.credit -= 1
+            return scan.popleft()
+        if scan:
+            self.credit += self.scan_share
+        return urgent.popleft()
+
+    def depth(self, priority):
+        return len(self.queues[priority])
+
+    def depths(self):
+        return {name: len(q) for (name, q) in zip(PRIORITY_NAMES, self.queues)}
@@ -9,7 +9,9 @@ from sqlalchemy import (
     Boolean,
     Column,
     DateTime,
+    Float,
     ForeignKey,
+    Index,
     Integer,
     MetaData,
     String,
@@ -47,9 +49,17 @@ class Schema(object):
         db_uri = config.get_database_uri()
         # Create, if needed, the database
         self.engine = create_engine(db_uri)
+        event.listen(self.engine, "connect", self._set_sqlite_profile)
         self.sessionmaker = sessionmaker(bind=self.engine)
         self.migrate(db_uri)
 
+    def _set_sqlite_profile(self, dbapi_connection, connection_record):
+        if isinstance(dbapi_connection, SQLite3Connection):
+            cursor = dbapi_connection.cursor()
+            for (name, value) in self.config.get_sqlite_pragmas():
+                cursor.execute("PRAGMA {}={};".format(name, value))
+            cursor.close()
+
     def migrate(self, db_uri):
         config = Config()
         cwd = os.path.abspath(os.path.dirname(__file__))
@@ -60,11 +70,14 @@ class Schema(object):
         tables = inspector.get_table_names()
         # Check if the table exists
         if "metas" in tables:
+            # Only the version, the rest of the columns of the model might not
+            # exist until the database is upgraded
             session = self.create_session()
-            meta = session.query(Meta).one_or_none()
+            version = session.query(Meta.version).scalar()
+            session.close()
             # Check the version in Meta
             # If version < 0.1.5, then stamp to e827c1336bb4
-            if meta and Version(meta.version) < Version("0.1.5"):
+            if version and Version(version) < Version("0.1.5"):
                 command.stamp(config, "e827c1336bb4")
         # Let alembic migrate to head, if needed
         command.upgrade(config, "head")
@@ -81,6 +94,8 @@ class Meta(Base):
     id = Column(Integer, primary_key=True)
     version = Column(String)
     root = Column(String)
+    # Number of the last scan of the root
+    generation = Column(Integer)
 
 
 class File(Base):
@@ -89,6 +104,15 @@ class File(Base):
     name = Column(String)
     path = Column(String)
     mtime = Column(DateTime)
+    # Fingerprint to detect changes
+    size = Column(BigInteger)
+    mtime_ns = Column(BigInteger)
+    inode = Column(BigInteger, index=True)
+    device = Column(BigInteger)
+    # Last scan that found the file
+    generation = Column(Integer, index=True)
+
+    __table_args__ = (Index("ix_files_path_name", "path", "name", unique=True),)
 
     info = relationship(
         "Info", uselist=False, back_populates="file", cascade="all, delete-orphan"
@@ -98,10 +122,20 @@ class File(Base):
     )
 
 
+class Directory(Base):
+    __tablename__ = "directories"
+    id = Column(Integer, primary_key=True)
+    path = Column(String, unique=True)
+    mtime_ns = Column(BigInteger)
+    children = Column(Integer)
+    # Last scan that enumerated the directory
+    generation = Column(Integer)
+
+
 class Info(Base):
     __tablename__ = "infos"
     id = Column(Integer, primary_key=True)
-    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"))
+    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), index=True)
 
     duration = Column(BigInteger)
     seekable = Column(Boolean)
@@ -109,6 +143,10 @@ class Info(Base):
     audio_streams = Column(Integer)
     video_streams = Column(Integer)
     subtitle_streams = Column(Integer)
+    # Hash of the stream tree, to skip storing it again when it did not change
+    topology_hash = Column(String)
+    # Seconds the last discovery took
+    discovery_time = Column(Float)
 
     file = relationship("File", back_populates="info")
     streams = relationship(
@@ -119,17 +157,20 @@ class Info(Base):
 class Stream(Base):
     __tablename__ = "streams"
     id = Column(Integer, primary_key=True)
-    parent_id = Column(Integer, ForeignKey("streams.id", ondelete="CASCADE"))
+    parent_id = Column(
+        Integer, ForeignKey("streams.id", ondelete="CASCADE"), index=True
+    )
 
-    info_id = Column(Integer, ForeignKey("infos.id", ondelete="CASCADE"))
+    info_id = Column(Integer, ForeignKey("infos.id", ondelete="CASCADE"), index=True)
     media_type = Column(String)
     type = Column(String)
+    # JSON objects of the caps fields and of the tags, by name. A tag stored in
+    # the blobs table is a {"blob": hash} object. The "fields" and "tags"
+    # views expose them as one row per name
+    fields = Column(String)
+    tags = Column(String)
 
     info = relationship("Info", back_populates="streams")
-    fields = relationship(
-        "Field", back_populates="stream", cascade="all, delete-orphan"
-    )
-    tags = relationship("Tag", back_populates="stream", cascade="all, delete-orphan")
     children = relationship("Stream", cascade="all, delete-orphan")
 
     __mapper_args__ = {"polymorphic_identity": "stream", "polymorphic_on": type}
@@ -207,35 +248,24 @@ class Container(Stream):
     }
 
 
-class Field(Base):
-    __tablename__ = "fields"
-    id = Column(Integer, primary_key=True)
-
-    stream_id = Column(Integer, ForeignKey("streams.id", ondelete="CASCADE"))
-
-    name = Column(String)
-    value = Column(String)
-
-    stream = relationship("Stream", back_populates="fields")
-
-
-class Tag(Base):
-    __tablename__ = "tags"
-    id = Column(Integer, primary_key=True)
-
-    stream_id = Column(Integer, ForeignKey("streams.id", ondelete="CASCADE"))
-
-    name = Column(String)
+class Blob(Base):
+    __tablename__ = "blobs"
+    hash = Column(String, primary_key=True)
     value = Column(String)
 
-    stream = relationship("Stream", back_populates="tags")
-
 
 class Error(Base):
     __tablename__ = "errors"
     id = Column(Integer, primary_key=True)
-    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"))
+    file_id = Column(Integer, ForeignKey("files.id", ondelete="CASCADE"), index=True)
 
+    # "error" for failed discoveries, "timeout" for the ones that timed out
+    kind = Column(String)
     error_log = Column(String)
+    # Fingerprint of the file that failed, it is not discovered again until
+    # it changes
+    size = Column(BigInteger)
+    mtime_ns = Column(BigInteger)
+    inode = Column(BigInteger)
 
     file = relationship("File", back_populates="error")
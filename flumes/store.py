@@ -0,0 +1,315 @@
+import hashlib
+import importlib
+import json
+
+import gi
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GstPbutils", "1.0")
+from gi.repository import GLib, Gst
+
+from . import metrics, structure
+from .schema import Blob, File, Info, Stream
+
+# Seconds a discovery time has to differ from the stored one to be written,
+# or half of the stored one if bigger, so rediscovering an unchanged file
+# does not write it every time
+DISCOVERY_TIME_TOLERANCE = 1.0
+
+
+def discovery_time_changed(stored, discovery_time):
+    if stored is None:
+        return True
+    tolerance = max(DISCOVERY_TIME_TOLERANCE, stored / 2)
+    return abs(discovery_time - stored) > tolerance
+
+
+def to_json(data):
+    if not data:
+        return None
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+class InfoStore(object):
+    """Stores a GstDiscovererInfo on the database rows of a file
+
+    The stream tree is first collected as a list of `(columns, parent)` nodes
+    in depth-first order, `parent` being the position of the parent node.
+    The caps fields and the tags of every stream are kept on it as JSON
+    objects. The hash of that list is kept on the info, so a rediscovery with
+    the same topology writes nothing, and a different one is diffed against
+    the stored streams to only write what changed. Streams are written with
+    Core statements, one by one as their ids are needed by their children.
+
+    Tags can be limited to the `allow` list or skip the `deny` list, and the
+    values longer than `max_size` are moved to the blobs table, addressed by
+    their hash, so the same cover art on a whole album is stored once. The
+    blobs the removed or changed streams referred to are released, and
+    deleted by `sweep_blobs` if no other stream refers to them.
+    """
+
+    def __init__(self, persister, allow=None, deny=None, max_size=0):
+        self.persister = persister
+        self.allow = set(allow or [])
+        self.deny = set(deny or [])
+        self.max_size = max_size
+        self.gst_override = None
+        self.nodes = []
+        self.blobs = {}
+        self.released = set()
+
+    def _has_gst_override(self):
+        # FIXME we need python3-gst-1.0 package to be installed in the virtualenv for
+        # unknown types (overrides). Sadly there is no pip package for it.
+        if self.gst_override is None:
+            spec = importlib.util.find_spec("gi.overrides.Gst")
+            self.gst_override = spec is not None
+        return self.gst_override
+
+    def _parse_type_value(self, s):
+        return structure.parse_fields(s)
+
+    def store_tag(self, tags, name, value):
+        if (self.allow and name not in self.allow) or name in self.deny:
+            return
+        if self.max_size and value and len(value.encode()) > self.max_size:
+            blob_hash = hashlib.sha1(value.encode()).hexdigest()
+            self.blobs[blob_hash] = value
+            tags[name] = {"blob": blob_hash}
+        else:
+            tags[name] = value
+
+    def store_stream_tags(self, tags, taglist):
+        def store_tag(tl, tag, *user_data):
+            (copied, value) = Gst.TagList.copy_value(tl, tag)
+            if copied:
+                self.store_tag(tags, tag, Gst.value_serialize(value))
+
+        found = self._has_gst_override()
+        if found:
+            taglist.foreach(store_tag, None)
+        else:
+            for (key, t, value) in self._parse_type_value(taglist.to_string()):
+                self.store_tag(tags, key, value)
+
+    def store_structure(self, fields, s):
+        def store_field(field_id, value, _unused):
+            # Add every GstStructure field
+            fields[GLib.quark_to_string(field_id)] = Gst.value_serialize(value)
+            return True
+
+        found = self._has_gst_override()
+        if found:
+            s.foreach(store_field, None)
+        else:
+            for (key, t, value) in self._parse_type_value(s.to_string()):
+                fields[key] = value
+
+    def stream_columns(self, sinfo):
+        if sinfo.__gtype__.name == "GstDiscovererContainerInfo":
+            return {"type": "container"}
+        elif sinfo.__gtype__.name == "GstDiscovererVideoInfo":
+            return {
+                "type": "video",
+                "bitrate": sinfo.get_bitrate(),
+                "depth": sinfo.get_depth(),
+                "framerate_denom": sinfo.get_framerate_denom(),
+                "framerate_num": sinfo.get_framerate_num(),
+                "height": sinfo.get_height(),
+                "max_bitrate": sinfo.get_max_bitrate(),
+                "par_denom": sinfo.get_par_denom(),
+                "par_num": sinfo.get_par_num(),
+                "width": sinfo.get_width(),
+                "is_image": sinfo.is_image(),
+                "is_interlaced": sinfo.is_interlaced(),
+            }
+        elif sinfo.__gtype__.name == "GstDiscovererAudioInfo":
+            return {
+                "type": "audio",
+                "channel_mask": sinfo.get_channel_mask(),
+                "channels": sinfo.get_channels(),
+                "sample_rate": sinfo.get_sample_rate(),
+                "bitrate": sinfo.get_bitrate(),
+                "max_bitrate": sinfo.get_max_bitrate(),
+                "depth": sinfo.get_depth(),
+                "language": sinfo.get_language(),
+            }
+        elif sinfo.__gtype__.name == "GstDiscovererSubtitleInfo":
+            return {"type": "subtitle", "language": sinfo.get_language()}
+        return {"type": "stream"}
+
+    def store_stream_info(self, sinfo, parent=None):
+        if not sinfo:
+            return
+
+        # Add the stream
+        columns = self.stream_columns(sinfo)
+        # Common fields
+        s = sinfo.get_caps().get_structure(0)
+        columns["media_type"] = s.get_name()
+        # Now the fields
+        fields = {}
+        self.store_structure(fields, s)
+        columns["fields"] = to_json(fields)
+
+        # Now the tags
+        tags = {}
+        taglist = sinfo.get_tags()
+        if taglist:
+            self.store_stream_tags(tags, taglist)
+        columns["tags"] = to_json(tags)
+
+        position = len(self.nodes)
+        self.nodes.append((columns, parent))
+        next_sinfo = sinfo.get_next()
+        if next_sinfo:
+            self.store_stream_info(next_sinfo)
+        elif sinfo.__gtype__.name == "GstDiscovererContainerInfo":
+            for s in sinfo.get_streams():
+                self.store_stream_info(s, position)
+
+    def topology_hash(self, nodes):
+        serialized = json.dumps(nodes, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(serialized.encode()).hexdigest()
+
+    def insert_streams(self, info_id, nodes, ids):
+        # `ids` holds the ids of the nodes before the first one in `nodes`
+        session = self.persister.session
+        for (columns, parent) in nodes:
+            values = dict(columns, info_id=info_id)
+            values["parent_id"] = ids[parent] if parent is not None else None
+            result = session.execute(Stream.__table__.insert(), values)
+            ids.append(result.inserted_primary_key[0])
+
+    def diff_streams(self, info_id, nodes):
+        session = self.persister.session
+        stream_table = Stream.__table__
+        stored = (
+            session.query(stream_table)
+            .filter(stream_table.c.info_id == info_id)
+            .order_by(stream_table.c.id)
+            .all()
+        )
+        ids = [row.id for row in stored]
+        positions = {stream_id: i for (i, stream_id) in enumerate(ids)}
+        # Keep the streams in the same position of the tree with the same type,
+        # the rest of the stored streams are removed and the new ones inserted
+        kept = 0
+        for (row, (columns, parent)) in zip(stored, nodes):
+            stored_parent = positions.get(row.parent_id)
+            if row.type != columns["type"] or stored_parent != parent:
+                break
+            changed = {k: v for (k, v) in columns.items() if getattr(row, k) != v}
+            if "tags" in changed:
+                self.release_blobs(row.tags)
+            if changed:
+                session.execute(
+                    stream_table.update()
+                    .where(stream_table.c.id == row.id)
+                    .values(**changed)
+                )
+            kept += 1
+        if kept < len(ids):
+            for row in stored[kept:]:
+                self.release_blobs(row.tags)
+            session.execute(
+                stream_table.delete().where(stream_table.c.id.in_(ids[kept:]))
+            )
+        self.insert_streams(info_id, nodes[kept:], ids[:kept])
+
+    def write_blobs(self):
+        # Content addressed, only the ones not stored yet are inserted
+        blob_table = Blob.__table__
+        hashes = list(self.blobs)
+        stored = self.persister.session.query(blob_table.c.hash).filter(
+            blob_table.c.hash.in_(hashes)
+        )
+        for (blob_hash,) in stored:
+            del self.blobs[blob_hash]
+        if self.blobs:
+            self.persister.session.execute(
+                blob_table.insert(),
+                [{"hash": h, "value": value} for (h, value) in self.blobs.items()],
+            )
+        self.blobs = {}
+
+    def blob_hashes(self, tags):
+        for value in json.loads(tags or "{}").values():
+            if isinstance(value, dict):
+                yield value["blob"]
+
+    def release_blobs(self, tags):
+        self.released.update(self.blob_hashes(tags))
+
+    def release_files(self, *criteria):
+        # The blobs of the streams of the files about to be deleted
+        stream_table = Stream.__table__
+        q = (
+            self.persister.session.query(stream_table.c.tags)
+            .join(Info, Info.id == stream_table.c.info_id)
+            .join(File, File.id == Info.file_id)
+            .filter(stream_table.c.tags.contains('{"blob":'), *criteria)
+        )
+        for (tags,) in q:
+            self.release_blobs(tags)
+
+    def sweep_blobs(self):
+        # Remove the released blobs no stream refers to anymore, only the
+        # streams with blobs are read
+        if not self.released:
+            return 0
+        stream_table = Stream.__table__
+        q = self.persister.session.query(stream_table.c.tags).filter(
+            stream_table.c.tags.contains('{"blob":')
+        )
+        for (tags,) in q:
+            self.released.difference_update(self.blob_hashes(tags))
+            if not self.released:
+                return 0
+        blob_table = Blob.__table__
+        result = self.persister.session.execute(
+            blob_table.delete().where(blob_table.c.hash.in_(self.released))
+        )
+        self.released = set()
+        return result.rowcount
+
+    def store(self, db_file, info, discovery_time=None):
+        # Topology, collected first so a StructureError leaves the database
+        # untouched
+        self.nodes = []
+        self.blobs = {}
+        with metrics.STORE_STREAM_INFO_SECONDS.time():
+            self.store_stream_info(info.get_stream_info())
+        topology_hash = self.topology_hash(self.nodes)
+
+        db_info = db_file.info
+        new = not db_info
+        if new:
+            db_info = Info(file=db_file)
+            self.persister.add(db_info)
+
+        # Common properties, only the ones that changed are written
+        db_info.duration = info.get_duration()
+        db_info.live = info.get_live()
+        db_info.seekable = info.get_seekable()
+        # Number of streams
+        db_info.audio_streams = len(info.get_audio_streams())
+        db_info.video_streams = len(info.get_video_streams())
+        db_info.subtitle_streams = len(info.get_subtitle_streams())
+        if discovery_time is not None and discovery_time_changed(
+            db_info.discovery_time, discovery_time
+        ):
+            db_info.discovery_time = discovery_time
+
+        if db_info.topology_hash == topology_hash:
+            return db_info
+        if self.blobs:
+            self.write_blobs()
+        # The streams need the id of the info
+        self.persister.session.flush()
+        if new:
+            self.insert_streams(db_info.id, self.nodes, [])
+        else:
+            self.diff_streams(db_info.id, self.nodes)
+        db_info.topology_hash = topology_hash
+        return db_info
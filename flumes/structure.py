@@ -0,0 +1,136 @@
+"""Parser of the text form of a GstStructure or a GstTagList
+
+Used when the Gst overrides are not available to walk the fields of a
+structure, it reads strings like:
+
+    audio/mpeg, mpegversion=(int)4, codec_data=(buffer)1190,
+    title=(string)"Big\\ Buck, Bunny", rates=(int){ 44100, 48000 },
+    size=(int)< 1, 2 >, inner=(structure)"s\\,\\ a\\=\\(int\\)1\\;";
+
+in a single pass. Quoted and unquoted strings are unescaped, while arrays,
+lists and ranges are kept as they are written. Strings without quotes,
+brackets or escapes, as most caps are, are simply split on commas.
+"""
+
+import re
+
+BRACKETS = {"<": ">", "{": "}", "[": "]"}
+# The separator, the key, the optional type and the value of the next field,
+# unless the value is bracketed
+FIELD = re.compile(
+    r"\s*,\s*([^=,;]*?)\s*=\s*(?:\(\s*([^)]*?)\s*\)\s*)?"
+    r'(?:"([^"\\]*(?:\\.[^"\\]*)*)"'
+    r'|((?:[^,;\\"<{\[\s(]|\\.)[^,;\\]*(?:\\.[^,;\\]*)*))?'
+)
+QUOTED = re.compile(r'"([^"\\]*(?:\\.[^"\\]*)*)"')
+NAME = re.compile(r'\s*(?:"([^"\\]*(?:\\.[^"\\]*)*)"|([^,;]*))')
+END = re.compile(r"\s*(?:,\s*)?(?:;\s*)?$")
+ESCAPE = re.compile(r"\\(.)")
+SPECIAL = re.compile(r'["\\<{\[]')
+
+
+class StructureError(Exception):
+    pass
+
+
+def unescape(s):
+    if "\\" in s:
+        return ESCAPE.sub(r"\1", s)
+    return s
+
+
+def read_bracketed(s, pos):
+    # Arrays, lists and ranges, nested or holding quoted strings
+    closing = []
+    start = pos
+    while pos < len(s):
+        c = s[pos]
+        if c == '"':
+            m = QUOTED.match(s, pos)
+            if not m:
+                break
+            pos = m.end()
+            continue
+        pos += 1
+        if c == "\\":
+            pos += 1
+        elif c in BRACKETS:
+            closing.append(BRACKETS[c])
+        elif c == closing[-1]:
+            closing.pop()
+            if not closing:
+                return (s[start:pos], pos)
+    raise StructureError("Unterminated brackets in {}".format(s))
+
+
+def parse_plain(s):
+    # Without quotes, brackets or escapes every comma separates two fields
+    plain = s.rstrip()
+    if plain.endswith(";"):
+        plain = plain[:-1]
+    parts = plain.split(",")
+    name = parts[0].strip()
+    # Trailing comma
+    if len(parts) > 1 and not parts[-1].strip():
+        del parts[-1]
+    fields = []
+    for part in parts[1:]:
+        (key, sep, value) = part.partition("=")
+        if not sep:
+            raise StructureError("Missing value of {} in {}".format(key, s))
+        value = value.strip()
+        field_type = None
+        if value.startswith("("):
+            (field_type, sep, value) = value[1:].partition(")")
+            if not sep:
+                raise StructureError("Unterminated type in {}".format(s))
+            field_type = field_type.strip()
+            value = value.strip()
+        if ";" in value or "(" in value:
+            raise StructureError("Unexpected {} in {}".format(value, s))
+        fields.append((key.strip(), field_type, value))
+    return (name, fields)
+
+
+def parse(s):
+    """Returns the name and the `(key, type, value)` fields of a structure"""
+    if not SPECIAL.search(s):
+        return parse_plain(s)
+    m = NAME.match(s)
+    if m.group(1) is not None:
+        name = unescape(m.group(1))
+    else:
+        name = m.group(2).strip()
+    pos = m.end()
+    fields = []
+    match = FIELD.match
+    while True:
+        m = match(s, pos)
+        if not m:
+            if END.match(s, pos):
+                break
+            raise StructureError("Unexpected {} in {}".format(s[pos:], s))
+        pos = m.end()
+        (key, field_type, quoted, value) = m.groups()
+        if quoted is not None:
+            value = unescape(quoted)
+        elif value is not None:
+            if value[-1].isspace():
+                value = value.rstrip()
+                # Keep an escaped trailing space
+                if value[-1] == "\\":
+                    value += " "
+            value = unescape(value)
+        elif s[pos : pos + 1] == '"':
+            raise StructureError("Unterminated string in {}".format(s))
+        elif s[pos : pos + 1] in BRACKETS:
+            (value, pos) = read_bracketed(s, pos)
+        else:
+            value = ""
+        fields.append((key, field_type, value))
+    return (name, fields)
+
+
+def parse_fields(s):
+    (name, fields) = parse(s)
+    return fields
@@ -0,0 +1,163 @@
+import logging
+import os
+
+import gi
+
+gi.require_version("Gio", "2.0")
+from gi.repository import Gio, GLib
+
+logger = logging.getLogger(__name__)
+
+MAX_USER_WATCHES = "/proc/sys/fs/inotify/max_user_watches"
+
+
+def max_watches():
+    # Leave some of the inotify watches for the rest of the user processes
+    try:
+        with open(MAX_USER_WATCHES) as f:
+            return int(int(f.read()) * 0.9)
+    except (OSError, ValueError):
+        return 8192
+
+
+def is_dir(f):
+    file_type = f.query_file_type(Gio.FileQueryInfoFlags.NOFOLLOW_SYMLINKS, None)
+    return file_type == Gio.FileType.DIRECTORY
+
+
+class Watcher(object):
+    """Monitors every directory of a tree
+
+    The events of a file are coalesced until no event happened on it for
+    `debounce` milliseconds and it is not being written anymore, so a file
+    being copied is only reported once, when the copy is done. Moves and
+    deletions are reported right away.
+    """
+
+    def __init__(self, handler, debounce=1000, limit=None):
+        self.handler = handler
+        self.debounce = debounce
+        self.limit = limit if limit is not None else max_watches()
+        self.monitors = {}
+        # path -> [writing, source id]
+        self.pending = {}
+        self.exhausted = False
+
+    def watch(self, path):
+        if path in self.monitors:
+            return
+        if len(self.monitors) >= self.limit:
+            if not self.exhausted:
+                logger.warning(
+                    "Watching {} directories, changes in the rest will only be "
+                    "found on rescans. Raise fs.inotify.max_user_watches or "
+                    "--max-watches to watch more".format(len(self.monitors))
+                )
+                self.exhausted = True
+            return
+        try:
+            monitor = Gio.File.new_for_path(path).monitor_directory(
+                Gio.FileMonitorFlags.WATCH_MOVES, None
+            )
+        except GLib.Error as e:
+            logger.warning("Can not watch {}: {}".format(path, e))
+            return
+        monitor.connect("changed", self.on_changed)
+        self.monitors[path] = monitor
+
+    def unwatch(self, path):
+        # Remove the directory and everything below it
+        prefix = os.path.join(path, "")
+        for p in [p for p in self.monitors if p == path or p.startswith(prefix)]:
+            self.monitors.pop(p).cancel()
+        for p in [p for p in self.pending if p == path or p.startswith(prefix)]:
+            self.cancel(p)
+
+    def is_watched(self, path):
+        return path in self.monitors
+
+    def cancel(self, path):
+        entry = self.pending.pop(path, None)
+        if entry and entry[1]:
+            GLib.source_remove(entry[1])
+
+    def touch(self, path, writing=None):
+        entry = self.pending.get(path)
+        if not entry:
+            entry = self.pending[path] = [False, None]
+        if writing is not None:
+            entry[0] = writing
+        if entry[1]:
+            GLib.source_remove(entry[1])
+        entry[1] = GLib.timeout_add(self.debounce, self.on_settled, path)
+
+    def on_settled(self, path):
+        entry = self.pending[path]
+        entry[1] = None
+        # Still being written, wait for the changes done hint
+        if entry[0]:
+            return False
+        del self.pending[path]
+        self.handler.file_ready(Gio.File.new_for_path(path))
+        return False
+
+    def on_changed(self, monitor, f, of, event_type):
+        path = f.get_path()
+        if event_type == Gio.FileMonitorEvent.CREATED:
+            if is_dir(f):
+                self.handler.dir_ready(f)
+            else:
+                self.touch(path)
+        elif event_type == Gio.FileMonitorEvent.CHANGED:
+            self.touch(path, True)
+        elif event_type == Gio.FileMonitorEvent.CHANGES_DONE_HINT:
+            # Only files created or changed are waited for
+            if path in self.pending:
+                self.touch(path, False)
+        elif event_type in (
+            Gio.FileMonitorEvent.RENAMED,
+            Gio.FileMonitorEvent.MOVED,
+        ):
+            self.moved(f, of)
+        elif event_type == Gio.FileMonitorEvent.MOVED_IN:
+            if of:
+                self.moved(of, f)
+            elif is_dir(f):
+                self.handler.dir_ready(f)
+            else:
+                self.touch(path)
+        elif event_type == Gio.FileMonitorEvent.MOVED_OUT and of:
+            # Moved to another watched directory, the destination will also
+            # get a MOVED_IN that will find the job done
+            self.moved(f, of)
+        elif event_type in (
+            Gio.FileMonitorEvent.DELETED,
+            Gio.FileMonitorEvent.MOVED_OUT,
+        ):
+            self.cancel(path)
+            if self.is_watched(path):
+                self.unwatch(path)
+                self.handler.dir_vanished(f)
+            else:
+                self.handler.file_vanished(f)
+
+    def moved(self, f, of):
+        path = f.get_path()
+        if self.is_watched(path):
+            self.unwatch(path)
+            self.handler.dir_moved(f, of)
+            return
+        # A file still being written keeps waiting on its new name
+        if path in self.pending:
+            writing = self.pending[path][0]
+            self.cancel(path)
+            self.touch(of.get_path(), writing)
+            return
+        self.handler.file_moved(f, of)
+
+    def stop(self):
+        for path in list(self.pending):
+            self.cancel(path)
+        for monitor in self.monitors.values():
+            monitor.cancel()
+        self.monitors = {}
@@ -16,6 +16,8 @@ file_path = "tests/samples/"
 origin_file = "big-buck-bunny-480p-30sec.mp4"
 destination_file = "sample-file.mp4"
 modify_file = "sample-file2.mp4"
+moved_dir = "moved"
+swept_dir = "swept"
 cwd = "tests"
 flumes_discoverer = (
     "python -m flumes.discoverer -d " + file_path + " -i " + sqlite_command
@@ -78,3 +80,14 @@ def get_num_entries_db():
         cwd=cwd,
     )
     return db_select_result.stdout[:-1]
+
+
+# Returns the output of a query on the database
+def query_db(query):
+    db_select_result = subprocess.run(
+        ["sqlite3", db_name, query],
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+    )
+    return db_select_result.stdout[:-1]
@@ -0,0 +1,65 @@
+import argparse
+import os
+
+import gi
+import pytest
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GstPbutils", "1.0")
+from gi.repository import Gst, GstPbutils
+
+from flumes.cache import InfoCache
+from flumes.config import Config
+from flumes.rebuild import Rebuilder
+from flumes.schema import File, Info, Schema, Stream
+
+SAMPLE = os.path.join(
+    os.path.dirname(__file__), "samples", "big-buck-bunny-480p-30sec.mp4"
+)
+
+
+@pytest.fixture(scope="module")
+def info():
+    Gst.init(None)
+    discoverer = GstPbutils.Discoverer.new(10 * Gst.SECOND)
+    return discoverer.discover_uri(Gst.filename_to_uri(SAMPLE))
+
+
+def test_round_trip(tmp_path, info):
+    cache = InfoCache(str(tmp_path))
+    fprint = (10, 100, 1000)
+    assert cache.get(fprint) is None
+    cache.put(fprint, info)
+    cached = cache.get(fprint)
+    assert cached.get_uri() == info.get_uri()
+    assert cached.get_duration() == info.get_duration()
+    assert len(cached.get_stream_list()) == len(info.get_stream_list())
+    assert cache.get((10, 100, 1001)) is None
+    # Files without a complete fingerprint are not cached
+    cache.put((10, 100, None), info)
+    assert cache.get((10, 100, None)) is None
+
+
+def test_rebuild(tmp_path, info):
+    args = argparse.Namespace(
+        config=None,
+        uri="sqlite:///{}".format(tmp_path / "flumes.db"),
+        cache=str(tmp_path / "cache"),
+    )
+    config = Config(args)
+    session = Schema(config).create_session()
+    for (name, inode) in [("a.mp4", 1000), ("b.mp4", 1001)]:
+        session.add(File(name=name, path="", size=10, mtime_ns=100, inode=inode))
+    session.commit()
+    session.close()
+    # Only the first one was discovered before
+    InfoCache(config.get_cache_directory()).put((10, 100, 1000), info)
+
+    assert Rebuilder(config).rebuild() == 1
+    session = Schema(config).create_session()
+    restored = session.query(File.name).join(File.info).all()
+    assert restored == [("a.mp4",)]
+    db_info = session.query(Info).one()
+    assert db_info.duration == info.get_duration()
+    assert session.query(Stream).count() > 0
+    session.close()
@@ -4,8 +4,17 @@ import signal
 import subprocess
 import time
 
+import gi
 import pytest
 
+gi.require_version("Gst", "1.0")
+gi.require_version("GstPbutils", "1.0")
+from gi.repository import GLib, Gst, GstPbutils
+
+from flumes import metrics
+from flumes.control import ControlError
+from flumes.discoverer import Discovery
+
 from .conftest import *
 
 #################################
@@ -56,6 +65,22 @@ def test_on_usr1_signal(discoverer):
     teardown
 
 
+# Commands of the control socket
+def test_control_commands(discoverer):
+    status = discoverer.control_status()
+    assert status["numdirs"] == discoverer.numdirs
+    assert status["discovery_paused"] == False
+    discoverer.control_pause()
+    assert discoverer.control_status()["discovery_paused"] == True
+    discoverer.control_resume()
+    assert discoverer.discovery_paused == False
+    with pytest.raises(ControlError):
+        discoverer.control_discover("../conftest.py")
+    with pytest.raises(ControlError):
+        discoverer.control_rescan(origin_file)
+    assert discoverer.control_discover(origin_file)["queued"] == True
+
+
 # Copy media file to monitored path
 def test_discover_newly_copied_file():
     # Setup
@@ -203,3 +228,191 @@ def test_error_table():
     assert gst in db_select_result.stdout
     # Teardown
     teardown
+
+
+# Files that failed are not discovered again until they change
+def test_failed_files():
+    setup
+    discoverer_handle = discoverer_run_once()
+    assert len(discoverer_handle.failed) == 1
+    db_select_result = subprocess.run(
+        [
+            "sqlite3",
+            db_name,
+            "select errors.kind, errors.size from errors inner join files on "
+            "files.id=errors.file_id where files.name = " + error_file + ";",
+        ],
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+    )
+    (kind, size) = db_select_result.stdout.strip().split("|")
+    assert kind == "error"
+    assert int(size) > 0
+    teardown
+
+
+# Files moved while not running keep their id and their discovery
+def test_moved_file_keeps_id():
+    setup
+    shutil.copy2(file_path + origin_file, file_path + destination_file)
+    discoverer_handle = discoverer_run_once()
+    discoverer_handle.start()
+    time.sleep(3)
+    file_id = query_db(
+        "select id from files where name='{}' and path='';".format(destination_file)
+    )
+    assert file_id
+    num_entries = get_num_entries_db()
+    # Test
+    os.makedirs(file_path + moved_dir)
+    os.rename(
+        file_path + destination_file,
+        os.path.join(file_path, moved_dir, destination_file),
+    )
+    discoverer_handle = discoverer_run_once()
+    discoverer_handle.start()
+    time.sleep(3)
+    assert (
+        query_db(
+            "select id from files where name='{}' and path='{}';".format(
+                destination_file, moved_dir
+            )
+        )
+        == file_id
+    )
+    assert (
+        query_db("select count(*) from infos where file_id={};".format(file_id)) == "1"
+    )
+    assert get_num_entries_db() == num_entries
+    # Teardown
+    shutil.rmtree(file_path + moved_dir)
+    teardown
+
+
+# Files deleted while not running are swept by the next scan
+def test_sweep_offline_deleted_files():
+    setup
+    os.makedirs(file_path + swept_dir)
+    shutil.copy2(
+        file_path + origin_file, os.path.join(file_path, swept_dir, destination_file)
+    )
+    discoverer_handle = discoverer_run_once()
+    discoverer_handle.start()
+    time.sleep(3)
+    assert (
+        query_db("select count(*) from files where path='{}';".format(swept_dir)) == "1"
+    )
+    num_entries = int(get_num_entries_db())
+    generation = int(query_db("select generation from metas;"))
+    # Test
+    shutil.rmtree(file_path + swept_dir)
+    discoverer_handle = discoverer_run_once()
+    discoverer_handle.start()
+    time.sleep(3)
+    assert int(query_db("select generation from metas;")) == generation + 1
+    assert (
+        query_db("select count(*) from files where path='{}';".format(swept_dir)) == "0"
+    )
+    assert (
+        query_db("select count(*) from directories where path='{}';".format(swept_dir))
+        == "0"
+    )
+    assert int(get_num_entries_db()) == num_entries - 1
+    teardown
+
+
+# An empty root, like an unmounted filesystem, does not sweep the known files
+def test_sweep_skipped_on_empty_root(tmp_path):
+    setup
+    discoverer_handle = discoverer_run_once()
+    discoverer_handle.start()
+    num_entries = int(get_num_entries_db())
+    assert num_entries > 0
+    # Test
+    options = DiscovererOptions()
+    args = options.parse_args(["-i", sqlite_command, "-d", str(tmp_path), "-q"])
+    discoverer_handle = Discoverer(Config(args), args)
+    discoverer_handle.start()
+    assert int(get_num_entries_db()) == num_entries
+    teardown
+
+
+# Timeouts grow with the size of the file and its last discovery time
+def test_discovery_timeout(discoverer):
+    # 5s, and 10 MiB per second
+    discovery = Discovery("file:///a.mp4", 100 * 2**20)
+    assert discoverer.discovery_timeout(discovery) == 15
+    discovery.expected = 20
+    assert discoverer.discovery_timeout(discovery) == 40
+    # Doubled on every attempt, from the maximum at most
+    discovery.attempt = 1
+    assert discoverer.discovery_timeout(discovery) == 80
+    discovery.size = 10 * 2**30
+    assert discoverer.discovery_timeout(discovery) == 120
+
+
+class TimedOut(object):
+    """A discovery result that timed out"""
+
+    def __init__(self, info):
+        self.info = info
+
+    def get_result(self):
+        return GstPbutils.DiscovererResult.TIMEOUT
+
+    def __getattr__(self, name):
+        return getattr(self.info, name)
+
+
+# Retried until the retries are exhausted, then recorded as a timeout
+def test_discovery_timeout_retries(discoverer):
+    setup
+    discoverer_handle = discoverer_run_once()
+    discoverer_handle.start()
+    path = os.path.abspath(file_path + origin_file)
+    info = GstPbutils.Discoverer.new(10 * Gst.SECOND).discover_uri(
+        Gst.filename_to_uri(path)
+    )
+    timed_out = TimedOut(info)
+    discovery = Discovery(info.get_uri(), os.path.getsize(path))
+    retries = metrics.DISCOVERY_RETRIES.value
+    discoverer.numdiscoveries = 1
+    # Test
+    for attempt in range(discoverer.retries + 1):
+        discoverer.discovering[info.get_uri()] = discovery
+        discovery.started = time.perf_counter()
+        discoverer.discoverers[discoverer.retry_discoverer] += 1
+        discoverer.on_discovered(discoverer.retry_discoverer, timed_out, None)
+    discoverer.flush()
+    assert discovery.attempt == discoverer.retries
+    assert metrics.DISCOVERY_RETRIES.value == retries + discoverer.retries
+    assert discoverer.numdiscoveries == 0
+    assert (
+        query_db(
+            "select kind from errors join files on files.id = errors.file_id "
+            "where name='{}';".format(origin_file)
+        )
+        == "timeout"
+    )
+    # Teardown
+    query_db("delete from errors;")
+    teardown
+
+
+# A partial batch is committed once its timeout expires
+def test_batch_timeout(discoverer):
+    setup
+    discoverer.persister.batch_size = 10
+    discoverer.add_file(modify_file, "", (1, 1, 1))
+    assert discoverer.flush_source
+    query = "select count(*) from files where name='{}';".format(modify_file)
+    assert query_db(query) == "0"
+    # Test
+    context = GLib.MainContext.default()
+    while discoverer.flush_source:
+        context.iteration(True)
+    assert query_db(query) == "1"
+    # Teardown
+    query_db("delete from files where name='{}';".format(modify_file))
+    teardown
@@ -1,6 +1,7 @@
 from flumes import __version__
 from flumes.config import Config
 from flumes.discoverer import Discoverer, DiscovererOptions
+from flumes.index import DirectoryIndex, FileIndex
 
 
 def test_version():
@@ -36,3 +37,71 @@ def test_config():
     assert config.get_database_username() == "jl"
     assert config.get_database_password() == "foo"
     assert config.get_database_uri() == "sqlite://jl:foo@//"
+    assert config.get_database_batch_size() == Config.DEFAULT_BATCH_SIZE
+    args = options.parse_args(["-e", "sqlite", "--batch-size", "10"])
+    config = Config(args)
+    assert config.get_database_batch_size() == 10
+    assert config.get_sqlite_pragmas() == [
+        ("journal_mode", "WAL"),
+        ("synchronous", "NORMAL"),
+    ]
+    args = options.parse_args(["-e", "sqlite", "--synchronous", "full"])
+    config = Config(args)
+    assert ("synchronous", "FULL") in config.get_sqlite_pragmas()
+    assert config.get_tags_deny() == []
+    assert config.get_tags_max_size() == Config.DEFAULT_TAG_MAX_SIZE
+    args = options.parse_args(["-e", "sqlite", "--tags-deny", "image, preview-image"])
+    config = Config(args)
+    assert config.get_tags_deny() == ["image", "preview-image"]
+    assert config.get_filter_extensions() == []
+    assert not config.get_filter_sniff()
+    args = options.parse_args(["-e", "sqlite", "--extensions", "mp4,mkv", "--sniff"])
+    config = Config(args)
+    assert config.get_filter_extensions() == ["mp4", "mkv"]
+    assert config.get_filter_sniff()
+
+
+def test_file_index():
+    index = FileIndex()
+    index.set("a/b", "c.mp4", 1, None)
+    index.set("a/b", "d.mp4", 2, None)
+    index.set("", "e.mp4", None, None)
+    assert len(index) == 3
+    assert index.get("a/b", "c.mp4") == (1, None)
+    assert index.get("a", "c.mp4") is None
+    index.remove("a/b", "c.mp4")
+    index.remove("a/b", "c.mp4")
+    assert len(index) == 2
+    assert index.get("a/b", "c.mp4") is None
+
+
+def test_file_index_find():
+    index = FileIndex()
+    index.set("a", "b.mp4", 1, (10, 100, 1000))
+    assert index.find((10, 100, 1000)) == ("a", "b.mp4")
+    index.set("c", "d.mp4", 2, (20, 200, 2000))
+    assert index.find((20, 200, 2000)) == ("c", "d.mp4")
+    # Changed or removed files are not found anymore
+    index.set("a", "b.mp4", 1, (11, 100, 1000))
+    assert index.find((10, 100, 1000)) is None
+    index.remove("c", "d.mp4")
+    assert index.find((20, 200, 2000)) is None
+    index.move_dir("a", "e")
+    assert index.find((11, 100, 1000)) == ("e", "b.mp4")
+
+
+def test_directory_index():
+    index = DirectoryIndex()
+    index.set("", 1, 2)
+    index.set("a", 1, 1)
+    index.set("a/b", 2, 0)
+    index.set("c", 3, 0)
+    assert index.children("") == {"a", "c"}
+    assert index.children("a") == {"a/b"}
+    index.move_dir("a", "d")
+    assert index.get("a") is None
+    assert index.get("d/b") == (2, 0)
+    assert index.children("") == {"c", "d"}
+    index.remove_dir("d")
+    assert index.children("") == {"c"}
+    assert index.get("d/b") is None
@@ -0,0 +1,30 @@
+from flumes.metrics import Histogram, Registry
+
+
+def test_histogram():
+    histogram = Histogram("flumes_test_seconds", "Test", (1, 2))
+    for value in (0.5, 1, 1.5, 3):
+        histogram.observe(value)
+    assert histogram.samples() == [
+        ("flumes_test_seconds_bucket", '{le="1"}', 2),
+        ("flumes_test_seconds_bucket", '{le="2"}', 3),
+        ("flumes_test_seconds_bucket", '{le="+Inf"}', 4),
+        ("flumes_test_seconds_sum", "", 6.0),
+        ("flumes_test_seconds_count", "", 4),
+    ]
+
+
+def test_render():
+    registry = Registry()
+    counter = registry.counter("flumes_test_total", "Test counter")
+    counter.inc()
+    counter.inc(2)
+    registry.gauge("flumes_test_depth", "Test gauge", lambda: 7)
+    assert registry.render() == (
+        "# HELP flumes_test_total Test counter\n"
+        "# TYPE flumes_test_total counter\n"
+        "flumes_test_total 3\n"
+        "# HELP flumes_test_depth Test gauge\n"
+        "# TYPE flumes_test_depth gauge\n"
+        "flumes_test_depth 7\n"
+    )
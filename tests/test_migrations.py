@@ -0,0 +1,161 @@
+import argparse
+import os
+import sqlite3
+
+from alembic import command
+from alembic.config import Config as AlembicConfig
+from alembic.script import ScriptDirectory
+
+import flumes
+from flumes.config import Config
+from flumes.schema import Schema
+
+# The first revision with the errors table, what older releases left behind
+BASELINE = "242be726f817"
+
+
+def alembic_config(db_path):
+    config = AlembicConfig()
+    cwd = os.path.abspath(os.path.dirname(flumes.__file__))
+    config.set_main_option("script_location", os.path.join(cwd, "alembic"))
+    config.set_main_option("sqlalchemy.url", "sqlite:///{}".format(db_path))
+    return config
+
+
+def create_baseline(db_path):
+    command.upgrade(alembic_config(db_path), BASELINE)
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        """
+        INSERT INTO metas (id, version, root) VALUES (1, '0.1.23', '/media');
+        INSERT INTO files (id, name, path, mtime)
+            VALUES (1, 'a.mp4', '', '2022-04-22 16:17:21');
+        INSERT INTO infos (id, file_id, duration, audio_streams, video_streams)
+            VALUES (1, 1, 30000000000, 1, 1);
+        INSERT INTO streams (id, info_id, media_type, type)
+            VALUES (1, 1, 'video/quicktime', 'container');
+        INSERT INTO streams (id, parent_id, info_id, media_type, type, width)
+            VALUES (2, 1, 1, 'video/x-h264', 'video', 854);
+        INSERT INTO fields (stream_id, name, value) VALUES (2, 'width', '854');
+        INSERT INTO fields (stream_id, name, value)
+            VALUES (2, 'profile', 'high');
+        INSERT INTO tags (stream_id, name, value)
+            VALUES (2, 'title', 'Big Buck Bunny');
+        INSERT INTO errors (id, file_id, error_log) VALUES (1, 1, 'failed');
+        """
+    )
+    conn.commit()
+    conn.close()
+
+
+def open_schema(db_path):
+    args = argparse.Namespace(config=None, uri="sqlite:///{}".format(db_path))
+    return Schema(Config(args))
+
+
+def test_upgrade_baseline(tmp_path):
+    db_path = str(tmp_path / "flumes.db")
+    create_baseline(db_path)
+    schema = open_schema(db_path)
+    schema.engine.dispose()
+
+    conn = sqlite3.connect(db_path)
+    heads = [r[0] for r in conn.execute("SELECT version_num FROM alembic_version")]
+    head = ScriptDirectory.from_config(alembic_config(db_path)).get_current_head()
+    assert heads == [head]
+    # The columns added later are there, and nothing was lost on the way
+    assert conn.execute("SELECT version, generation FROM metas").fetchall() == [
+        ("0.1.23", 0)
+    ]
+    assert conn.execute("SELECT id, name FROM files").fetchall() == [(1, "a.mp4")]
+    assert conn.execute("SELECT file_id, duration FROM infos").fetchall() == [
+        (1, 30000000000)
+    ]
+    assert conn.execute("SELECT COUNT(*) FROM streams").fetchone() == (2,)
+    assert conn.execute("SELECT file_id, kind FROM errors").fetchall() == [(1, "error")]
+    conn.close()
+
+
+def test_downgrade_to_baseline(tmp_path):
+    db_path = str(tmp_path / "flumes.db")
+    create_baseline(db_path)
+    open_schema(db_path).engine.dispose()
+    command.downgrade(alembic_config(db_path), BASELINE)
+
+    # Recreating a table must not delete the rows that reference it
+    conn = sqlite3.connect(db_path)
+    for (table, count) in [
+        ("files", 1),
+        ("infos", 1),
+        ("streams", 2),
+        ("fields", 2),
+        ("tags", 1),
+        ("errors", 1),
+    ]:
+        assert conn.execute("SELECT COUNT(*) FROM {}".format(table)).fetchone() == (
+            count,
+        ), table
+    conn.close()
+
+
+def test_fields_and_tags_views(tmp_path):
+    db_path = str(tmp_path / "flumes.db")
+    create_baseline(db_path)
+    open_schema(db_path).engine.dispose()
+
+    # The rows of the old tables end up on their streams, and the views show
+    # them as they were
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT fields, tags FROM streams WHERE id = 2").fetchone() == (
+        '{"width":"854","profile":"high"}',
+        '{"title":"Big Buck Bunny"}',
+    )
+    assert sorted(conn.execute("SELECT stream_id, name, value FROM fields")) == [
+        (2, "profile", "high"),
+        (2, "width", "854"),
+    ]
+    assert conn.execute(
+        "SELECT stream_id, name, value, blob_hash FROM tags"
+    ).fetchall() == [(2, "title", "Big Buck Bunny", None)]
+    assert conn.execute("SELECT fields, tags FROM streams WHERE id = 1").fetchone() == (
+        None,
+        None,
+    )
+    conn.close()
+
+
+def test_backfill_fingerprint(tmp_path):
+    db_path = str(tmp_path / "flumes.db")
+    command.upgrade(alembic_config(db_path), BASELINE)
+    media = tmp_path / "media"
+    media.mkdir()
+    # Indexed as it is on disk, and modified after it was indexed
+    mtime_ns = 1650644241123456789
+    for name in ["same.mp4", "changed.mp4"]:
+        (media / name).write_bytes(b"\x00" * 10)
+        os.utime(str(media / name), ns=(mtime_ns, mtime_ns))
+    os.utime(str(media / "changed.mp4"), ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "INSERT INTO metas (id, version, root) VALUES (1, '0.1.23', ?)", (str(media),)
+    )
+    for (file_id, name) in [(1, "same.mp4"), (2, "changed.mp4"), (3, "gone.mp4")]:
+        conn.execute(
+            "INSERT INTO files (id, name, path, mtime) "
+            "VALUES (?, ?, '', '2022-04-22 16:17:21.123456')",
+            (file_id, name),
+        )
+    conn.commit()
+    conn.close()
+    open_schema(db_path).engine.dispose()
+
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT name, size, mtime_ns, inode FROM files ORDER BY id")
+    usec = 1650644241123456000
+    inode = os.stat(str(media / "same.mp4")).st_ino
+    assert rows.fetchall() == [
+        ("same.mp4", 10, usec, inode),
+        ("changed.mp4", None, usec, None),
+        ("gone.mp4", None, usec, None),
+    ]
+    conn.close()
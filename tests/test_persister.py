@@ -0,0 +1,81 @@
+import argparse
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from flumes.config import Config
+from flumes.persister import Persister
+from flumes.schema import File, Schema
+
+
+@pytest.fixture
+def schema(tmp_path):
+    args = argparse.Namespace(
+        config=None, uri="sqlite:///{}".format(tmp_path / "flumes.db")
+    )
+    return Schema(Config(args))
+
+
+def committed(schema):
+    session = schema.create_session()
+    names = [name for (name,) in session.query(File.name).order_by(File.name)]
+    session.close()
+    return names
+
+
+def test_batch_size(schema):
+    persister = Persister(schema.create_session, 3)
+    for name in ["a.mp4", "b.mp4"]:
+        persister.add(File(name=name, path=""))
+        persister.done()
+    assert persister.pending == 2
+    assert committed(schema) == []
+    # The batch is full
+    persister.add(File(name="c.mp4", path=""))
+    persister.done()
+    assert persister.pending == 0
+    assert committed(schema) == ["a.mp4", "b.mp4", "c.mp4"]
+
+
+def test_flush(schema):
+    # What the owner does once the batch timeout expires
+    persister = Persister(schema.create_session, 10, 1000)
+    persister.add(File(name="a.mp4", path=""))
+    persister.done()
+    assert committed(schema) == []
+    persister.flush()
+    assert persister.pending == 0
+    assert committed(schema) == ["a.mp4"]
+    # Nothing pending, nothing to do
+    persister.flush()
+    assert committed(schema) == ["a.mp4"]
+
+
+def test_commit_error(schema):
+    errors = []
+    persister = Persister(schema.create_session, 10, on_error=errors.append)
+    for name in ["a.mp4", "a.mp4"]:
+        persister.add(File(name=name, path=""))
+        persister.done()
+    persister.flush()
+    # The batch is lost, the owner is told and the next batch goes on
+    assert len(errors) == 1
+    assert isinstance(errors[0], IntegrityError)
+    assert persister.pending == 0
+    assert committed(schema) == []
+    persister.add(File(name="b.mp4", path=""))
+    persister.done()
+    persister.flush()
+    assert committed(schema) == ["b.mp4"]
+
+
+def test_commit_error_raised(schema):
+    # Without an owner to recover the batch, it is raised
+    persister = Persister(schema.create_session, 10)
+    for name in ["a.mp4", "a.mp4"]:
+        persister.add(File(name=name, path=""))
+        persister.done()
+    with pytest.raises(IntegrityError):
+        persister.flush()
+    assert persister.pending == 0
+    assert committed(schema) == []
@@ -0,0 +1,61 @@
+import pytest
+
+from flumes.prefilter import Prefilter, sniff
+
+
+def test_accepts():
+    prefilter = Prefilter()
+    assert prefilter.accepts("a/b.nfo")
+    prefilter = Prefilter(extensions=["MP4", ".mkv"])
+    assert prefilter.accepts("a/b.mp4")
+    assert prefilter.accepts("b.MKV")
+    assert not prefilter.accepts("a/b.nfo")
+    assert not prefilter.accepts("a/mp4")
+    prefilter = Prefilter(include=["movies/*"], exclude=["*.nfo", "*/extras/*"])
+    assert prefilter.accepts("movies/a.mp4")
+    assert not prefilter.accepts("music/a.mp3")
+    assert not prefilter.accepts("movies/a.nfo")
+    assert not prefilter.accepts("movies/b/extras/a.mp4")
+
+
+@pytest.mark.parametrize(
+    "head,media",
+    [
+        (b"", False),
+        (b"SQLite format 3\x00" + b"\x00" * 100, False),
+        (b"PK\x03\x04\x14\x00", False),
+        (b"Title: Big Buck Bunny\nYear: 2008\n", False),
+        ("\ufeffPlot: été\n".encode("utf-8"), False),
+        (b"1\n00:00:01,000 --> 00:00:02,000\nHello\n", True),
+        (b"WEBVTT\n\n", True),
+        (b"#EXTM3U\n#EXTINF:10,\na.mp3\n", True),
+        (b"{0}{25}Hello\n{25}{50}World\n", True),
+        (b"[10][25]Hello\n", True),
+        (b"<SAMI>\n<BODY>\n", True),
+        (b"[playlist]\nFile1=a.mp3\n", True),
+        (b"[Notes]\nplot=none\n", False),
+        (b"\x00\x00\x00\x20ftypisom\x00\x00\x02\x00", True),
+        (b"ID3\x04\x00\x00\x00\x00\x00\x00\xff\xfb\x90", True),
+        (b"\x1aE\xdf\xa3\x9fB\x86\x81\x01", True),
+    ],
+)
+def test_sniff(tmp_path, head, media):
+    path = tmp_path / "file"
+    path.write_bytes(head)
+    assert sniff(str(path)) == media
+
+
+def test_sniff_text_extensions(tmp_path):
+    # Any text is accepted from the subtitle and playlist extensions
+    for name in ["a.sub", "a.SMI", "a.pls"]:
+        path = tmp_path / name
+        path.write_bytes(b"Hello\n")
+        assert sniff(str(path))
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"Hello\n")
+    assert not sniff(str(path))
+
+
+def test_sniff_missing(tmp_path):
+    # The discovery reports files that can not be read
+    assert sniff(str(tmp_path / "missing"))
@@ -0,0 +1,26 @@
+from flumes.scheduler import LIVE, REQUEST, SCAN, Scheduler
+
+
+def test_priority_order():
+    scheduler = Scheduler(scan_share=0)
+    scheduler.push("scan", SCAN)
+    scheduler.push("request", REQUEST)
+    scheduler.push("live", LIVE)
+    assert len(scheduler) == 3
+    assert scheduler.depths() == {"live": 1, "request": 1, "scan": 1}
+    assert scheduler.depth(REQUEST) == 1
+    assert [scheduler.pop() for i in range(3)] == ["live", "request", "scan"]
+    assert not scheduler
+
+
+def test_scan_share():
+    scheduler = Scheduler(scan_share=0.25)
+    for i in range(10):
+        scheduler.push("scan{}".format(i), SCAN)
+        scheduler.push("live{}".format(i), LIVE)
+    popped = [scheduler.pop() for i in range(10)]
+    # One of every five dispatches goes to the scan while changes wait
+    assert popped.count("scan0") == 1
+    assert popped.count("scan1") == 1
+    assert popped[4] == "scan0"
+    assert popped[9] == "scan1"
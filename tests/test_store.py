@@ -0,0 +1,194 @@
+import argparse
+import os
+
+import gi
+import pytest
+from sqlalchemy import event
+
+gi.require_version("Gst", "1.0")
+gi.require_version("GstPbutils", "1.0")
+from gi.repository import Gst, GstPbutils
+
+from flumes.config import Config
+from flumes.persister import Persister
+from flumes.schema import Blob, File, Schema, Stream
+from flumes.store import InfoStore
+
+SAMPLE = os.path.join(
+    os.path.dirname(__file__), "samples", "big-buck-bunny-480p-30sec.mp4"
+)
+
+
+@pytest.fixture(scope="module")
+def info():
+    Gst.init(None)
+    discoverer = GstPbutils.Discoverer.new(10 * Gst.SECOND)
+    return discoverer.discover_uri(Gst.filename_to_uri(SAMPLE))
+
+
+@pytest.fixture
+def persister(tmp_path):
+    args = argparse.Namespace(
+        config=None, uri="sqlite:///{}".format(tmp_path / "flumes.db")
+    )
+    schema = Schema(Config(args))
+    return Persister(schema.create_session)
+
+
+def add_file(persister, name="a.mp4"):
+    db_file = File(name=name, path="")
+    persister.add(db_file)
+    persister.flush()
+    return db_file.id
+
+
+def stream_statements(persister):
+    # The statements writing streams, from now on
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith(("INSERT INTO streams", "UPDATE streams")):
+            statements.append(statement.split()[0])
+        elif statement.startswith("DELETE FROM streams"):
+            statements.append("DELETE")
+
+    event.listen(persister.session.get_bind(), "before_cursor_execute", record)
+    return statements
+
+
+def store(persister, store, file_id, info):
+    db_file = persister.session.get(File, file_id)
+    store.store(db_file, info)
+    info_id = db_file.info.id
+    persister.flush()
+    return info_id
+
+
+def stored_streams(persister, info_id):
+    table = Stream.__table__
+    rows = (
+        persister.session.query(table.c.id, table.c.type, table.c.tags)
+        .filter(table.c.info_id == info_id)
+        .order_by(table.c.id)
+        .all()
+    )
+    persister.flush()
+    return rows
+
+
+def test_topology_hash(persister, info):
+    info_store = InfoStore(persister)
+    info_store.store_stream_info(info.get_stream_info())
+    nodes = info_store.nodes
+    assert len(nodes) > 1
+    assert info_store.topology_hash(nodes) == info_store.topology_hash(list(nodes))
+    (columns, parent) = nodes[-1]
+    changed = nodes[:-1] + [(dict(columns, tags='{"title":"Other"}'), parent)]
+    assert info_store.topology_hash(changed) != info_store.topology_hash(nodes)
+
+
+def test_store_unchanged(persister, info):
+    info_store = InfoStore(persister)
+    file_id = add_file(persister)
+    info_id = store(persister, info_store, file_id, info)
+    streams = stored_streams(persister, info_id)
+    assert streams
+    # The same discovery again writes no stream
+    statements = stream_statements(persister)
+    store(persister, info_store, file_id, info)
+    assert statements == []
+    assert stored_streams(persister, info_id) == streams
+
+
+def test_diff_streams(persister, info):
+    info_store = InfoStore(persister)
+    file_id = add_file(persister)
+    info_id = store(persister, info_store, file_id, info)
+    streams = stored_streams(persister, info_id)
+    nodes = info_store.nodes
+    statements = stream_statements(persister)
+
+    # Only the stream with different tags is updated
+    (columns, parent) = nodes[-1]
+    changed = nodes[:-1] + [(dict(columns, tags='{"title":"Other"}'), parent)]
+    info_store.diff_streams(info_id, changed)
+    persister.flush()
+    assert statements == ["UPDATE"]
+    assert stored_streams(persister, info_id) == streams[:-1] + [
+        (streams[-1].id, streams[-1].type, '{"title":"Other"}')
+    ]
+
+    # A stream that is gone is deleted, the rest is kept as is
+    del statements[:]
+    info_store.diff_streams(info_id, changed[:-1])
+    persister.flush()
+    assert statements == ["DELETE"]
+    assert stored_streams(persister, info_id) == streams[:-1]
+
+    # A new one is inserted after the kept ones
+    del statements[:]
+    info_store.diff_streams(info_id, changed)
+    persister.flush()
+    assert statements == ["INSERT"]
+    assert [s.id for s in stored_streams(persister, info_id)[:-1]] == [
+        s.id for s in streams[:-1]
+    ]
+
+
+def test_tags_allow_deny(persister):
+    tags = {}
+    info_store = InfoStore(persister, allow=["title", "image"], deny=["image"])
+    info_store.store_tag(tags, "title", "Big Buck Bunny")
+    info_store.store_tag(tags, "artist", "Blender Foundation")
+    info_store.store_tag(tags, "image", "data")
+    assert tags == {"title": "Big Buck Bunny"}
+    tags = {}
+    info_store = InfoStore(persister, deny=["image"])
+    info_store.store_tag(tags, "title", "Big Buck Bunny")
+    info_store.store_tag(tags, "image", "data")
+    assert tags == {"title": "Big Buck Bunny"}
+
+
+def test_tags_max_size(persister):
+    tags = {}
+    info_store = InfoStore(persister, max_size=4)
+    info_store.store_tag(tags, "title", "abcd")
+    # Longer than the limit once encoded
+    info_store.store_tag(tags, "artist", "ééé")
+    assert tags["title"] == "abcd"
+    assert list(tags["artist"]) == ["blob"]
+    assert info_store.blobs == {tags["artist"]["blob"]: "ééé"}
+
+
+def count_blobs(persister):
+    count = persister.session.query(Blob).count()
+    persister.flush()
+    return count
+
+
+def delete_file(persister, info_store, file_id):
+    info_store.release_files(File.id == file_id)
+    persister.session.query(File).filter(File.id == file_id).delete()
+    removed = info_store.sweep_blobs()
+    persister.flush()
+    return removed
+
+
+def test_blobs(persister, info):
+    # Every tag is stored as a blob, once for both files
+    info_store = InfoStore(persister, max_size=1)
+    first = add_file(persister, "a.mp4")
+    second = add_file(persister, "b.mp4")
+    store(persister, info_store, first, info)
+    blobs = count_blobs(persister)
+    assert blobs > 0
+    store(persister, info_store, second, info)
+    assert count_blobs(persister) == blobs
+
+    # Nothing released, nothing to sweep
+    assert info_store.sweep_blobs() == 0
+    # Still referenced by the other file
+    assert delete_file(persister, info_store, first) == 0
+    assert count_blobs(persister) == blobs
+    assert delete_file(persister, info_store, second) == blobs
+    assert count_blobs(persister) == 0
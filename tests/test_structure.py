@@ -0,0 +1,108 @@
+import pytest
+
+from flumes.structure import StructureError, parse, parse_fields
+
+# to_string() outputs of GstStructure and GstTagList, with their expected
+# name and fields
+CORPUS = [
+    (
+        "video/x-h264, stream-format=(string)avc, alignment=(string)au, "
+        "level=(string)3, profile=(string)high, codec_data=(buffer)01640"
+        "01effe1001b, width=(int)854, height=(int)480, framerate=(fraction)30/1, "
+        "pixel-aspect-ratio=(fraction)1/1, parsed=(boolean)true;",
+        "video/x-h264",
+        [
+            ("stream-format", "string", "avc"),
+            ("alignment", "string", "au"),
+            ("level", "string", "3"),
+            ("profile", "string", "high"),
+            ("codec_data", "buffer", "01640" "01effe1001b"),
+            ("width", "int", "854"),
+            ("height", "int", "480"),
+            ("framerate", "fraction", "30/1"),
+            ("pixel-aspect-ratio", "fraction", "1/1"),
+            ("parsed", "boolean", "true"),
+        ],
+    ),
+    (
+        'taglist, title=(string)"Big\\ Buck\\,\\ Bunny", '
+        'artist=(string)"Blender \\"Foundation\\"", track-number=(uint)3;',
+        "taglist",
+        [
+            ("title", "string", "Big Buck, Bunny"),
+            ("artist", "string", 'Blender "Foundation"'),
+            ("track-number", "uint", "3"),
+        ],
+    ),
+    (
+        "taglist, comment=(string)a\\,\\ b\\;\\ c, encoder=(string)Lavf58.76.100;",
+        "taglist",
+        [
+            ("comment", "string", "a, b; c"),
+            ("encoder", "string", "Lavf58.76.100"),
+        ],
+    ),
+    (
+        "audio/x-raw, rate=(int){ 44100, 48000 }, channels=(int)[ 1, 2 ], "
+        "channel-positions=(GstAudioChannelPosition)< front-left, front-right >;",
+        "audio/x-raw",
+        [
+            ("rate", "int", "{ 44100, 48000 }"),
+            ("channels", "int", "[ 1, 2 ]"),
+            (
+                "channel-positions",
+                "GstAudioChannelPosition",
+                "< front-left, front-right >",
+            ),
+        ],
+    ),
+    (
+        'application/x-test, lists=(string){ "a, b", "c }" }, '
+        "nested=(int)< < 1, 2 >, < 3, 4 > >;",
+        "application/x-test",
+        [
+            ("lists", "string", '{ "a, b", "c }" }'),
+            ("nested", "int", "< < 1, 2 >, < 3, 4 > >"),
+        ],
+    ),
+    (
+        'application/x-test, inner=(structure)"s\\,\\ a\\=\\(int\\)1\\;", '
+        "after=(int)2;",
+        "application/x-test",
+        [
+            ("inner", "structure", "s, a=(int)1;"),
+            ("after", "int", "2"),
+        ],
+    ),
+    (
+        'taglist, empty=(string)"", untyped=value, spaced = (int) 5 ;',
+        "taglist",
+        [
+            ("empty", "string", ""),
+            ("untyped", None, "value"),
+            ("spaced", "int", "5"),
+        ],
+    ),
+    ("taglist;", "taglist", []),
+    ("audio/mpeg", "audio/mpeg", []),
+]
+
+
+@pytest.mark.parametrize("s,name,fields", CORPUS)
+def test_parse_corpus(s, name, fields):
+    assert parse(s) == (name, fields)
+    assert parse_fields(s) == fields
+
+
+@pytest.mark.parametrize(
+    "s",
+    [
+        'taglist, title=(string)"unterminated;',
+        "taglist, rates=(int){ 1, 2;",
+        "taglist, title;",
+        "taglist, title=(string;",
+    ],
+)
+def test_parse_errors(s):
+    with pytest.raises(StructureError):
+        parse(s)
@@ -0,0 +1,59 @@
+import gi
+
+gi.require_version("Gio", "2.0")
+from gi.repository import Gio, GLib
+
+from flumes.watcher import Watcher
+
+
+class Handler(object):
+    def __init__(self):
+        self.ready = []
+
+    def file_ready(self, f):
+        self.ready.append(f.get_path())
+
+
+def run_loop(milliseconds):
+    loop = GLib.MainLoop()
+    GLib.timeout_add(milliseconds, loop.quit)
+    loop.run()
+
+
+# The events of a file being copied are reported once, when it is done
+def test_debounce_coalesces_events(tmp_path):
+    path = tmp_path / "sample-file.mp4"
+    path.write_bytes(b"")
+    f = Gio.File.new_for_path(str(path))
+    handler = Handler()
+    watcher = Watcher(handler, debounce=100)
+    watcher.on_changed(None, f, None, Gio.FileMonitorEvent.CREATED)
+    for i in range(5):
+        watcher.on_changed(None, f, None, Gio.FileMonitorEvent.CHANGED)
+        run_loop(20)
+    # Still being written
+    run_loop(300)
+    assert handler.ready == []
+    watcher.on_changed(None, f, None, Gio.FileMonitorEvent.CHANGES_DONE_HINT)
+    run_loop(300)
+    assert handler.ready == [str(path)]
+    assert not watcher.pending
+    watcher.stop()
+
+
+# Moving a file still being written keeps waiting on its new name
+def test_debounce_follows_moves(tmp_path):
+    path = tmp_path / "sample-file.mp4"
+    path.write_bytes(b"")
+    moved = tmp_path / "sample-file2.mp4"
+    f = Gio.File.new_for_path(str(path))
+    of = Gio.File.new_for_path(str(moved))
+    handler = Handler()
+    watcher = Watcher(handler, debounce=100)
+    watcher.on_changed(None, f, None, Gio.FileMonitorEvent.CREATED)
+    watcher.on_changed(None, f, None, Gio.FileMonitorEvent.CHANGED)
+    watcher.on_changed(None, f, of, Gio.FileMonitorEvent.RENAMED)
+    watcher.on_changed(None, of, None, Gio.FileMonitorEvent.CHANGES_DONE_HINT)
+    run_loop(300)
+    assert handler.ready == [str(moved)]
+    watcher.stop()